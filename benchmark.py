@@ -0,0 +1,258 @@
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from nonogram import (calculate_clues, display_nonogram, generate_nonogram, generate_structured_grid, stream_nonogram,
+                      validate_nonogram)
+from instrumentation import percentile
+from nonogram_solver import solve_nonogram
+from sudoku_core import generate_sudoku
+
+# Benchmarks for the hot paths. Run `python benchmark.py --json run.json` to
+# record a run and `python benchmark.py --baseline run.json` to compare a
+# later run against it; the exit status is 1 if any case got slower than the
+# threshold allows.
+
+# Solving is much slower than the other operations, so it stops at this size
+MAX_SOLVE_SIZE = 100
+
+# Headless modules that services and batch jobs import; each is timed in a
+# fresh interpreter and must not pull in Kivy
+CORE_MODULES = ("nonogram", "nonogram_solver", "nonogram_hints", "nonogram_difficulty", "nonogram_library",
+                "nonogram_book", "sudoku_core", "instrumentation", "puzzle_prefetch", "puzzle_grading")
+
+_IMPORT_PROBE = (
+    "import sys, time\n"
+    "start = time.perf_counter()\n"
+    "import {module}\n"
+    "elapsed = time.perf_counter() - start\n"
+    "print(elapsed, any(name == 'kivy' or name.startswith('kivy.') for name in sys.modules))\n"
+)
+
+
+def _grid(size, density, seed=0):
+    return generate_structured_grid(size, size, density, random.Random(seed))
+
+
+def _clues(grid):
+    height, width = len(grid), len(grid[0])
+    row_clues = [calculate_clues(row) for row in grid]
+    column_clues = [calculate_clues([grid[r][c] for r in range(height)]) for c in range(width)]
+    return row_clues, column_clues
+
+
+def cases(sizes, densities, batch_sizes):
+    """Yield (name, setup) pairs; setup() prepares the inputs and returns the operation to time."""
+    for size in sizes:
+        for density in densities:
+            def clue_setup(size=size, density=density):
+                grid = _grid(size, density)
+                return lambda: _clues(grid)
+            yield f"calculate_clues/{size}x{size}/d{density}", clue_setup
+
+            def generate_setup(size=size, density=density):
+                rng = random.Random(0)
+                return lambda: generate_nonogram(size, size, density, rng=rng)
+            yield f"generate_nonogram/{size}x{size}/d{density}", generate_setup
+
+            def stream_setup(size=size, density=density):
+                rng = random.Random(0)
+
+                def stream():
+                    rows, columns = stream_nonogram(size, size, density, rng)
+                    for _ in rows:
+                        pass
+                    for _ in columns:
+                        pass
+                return stream
+            yield f"stream_nonogram/{size}x{size}/d{density}", stream_setup
+
+        def validate_setup(size=size):
+            grid = _grid(size, 0.5)
+            row_clues, column_clues = _clues(grid)
+            return lambda: validate_nonogram(grid, row_clues, column_clues)
+        yield f"validate_nonogram/{size}x{size}", validate_setup
+
+        def display_setup(size=size):
+            grid = _grid(size, 0.5)
+            row_clues, column_clues = _clues(grid)
+            return lambda: display_nonogram(grid, row_clues, column_clues, file=io.StringIO())
+        yield f"display_nonogram/{size}x{size}", display_setup
+
+        if size <= MAX_SOLVE_SIZE:
+            def solve_setup(size=size):
+                row_clues, column_clues = _clues(_grid(size, 0.6))
+                return lambda: solve_nonogram(row_clues, column_clues)
+            yield f"solve_nonogram/{size}x{size}", solve_setup
+
+    try:
+        from nonogram_batch import batch_clues, generate_grids, generate_nonograms, pack_clues, validate_batch
+    except ImportError:
+        # The batch cases need NumPy
+        pass
+    else:
+        for batch in batch_sizes:
+            def batch_setup(batch=batch):
+                grids = generate_grids(batch, 25, 25, 0.5, rng=0)
+                return lambda: batch_clues(grids)
+            yield f"batch_clues/{batch}x25x25", batch_setup
+
+            def batch_validate_setup(batch=batch):
+                grids, row_clues, column_clues = generate_nonograms(batch, 25, 25, 0.5, rng=0)
+                row_clues, column_clues = pack_clues(row_clues, 25), pack_clues(column_clues, 25)
+                return lambda: validate_batch(grids, row_clues, column_clues)
+            yield f"validate_batch/{batch}x25x25", batch_validate_setup
+
+    for base in (3, 4):
+        def sudoku_setup(base=base):
+            rng = random.Random(0)
+            return lambda: generate_sudoku(base, rng=rng)
+        yield f"generate_sudoku/{base * base}x{base * base}", sudoku_setup
+
+
+def measure(operation, min_time=0.5, min_reps=5, max_reps=1000):
+    """Time `operation` until it has run for `min_time` seconds and at least `min_reps` times.
+
+    Returns a dict with ops_per_sec, p50_ms, p99_ms, peak_kib and reps; the
+    peak traced memory comes from one extra run under tracemalloc, kept out
+    of the timings.
+    """
+    operation()  # warm up caches and lazy imports
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < max_reps and (len(latencies) < min_reps or time.perf_counter() - started < min_time):
+        start = time.perf_counter()
+        operation()
+        latencies.append(time.perf_counter() - start)
+    total = sum(latencies)
+
+    tracemalloc.start()
+    try:
+        operation()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "ops_per_sec": len(latencies) / total if total else float("inf"),
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "peak_kib": peak / 1024,
+        "reps": len(latencies),
+    }
+
+
+def measure_import(module, reps=5):
+    """Time `import module` in `reps` fresh interpreters.
+
+    Returns the same fields as measure(), without peak_kib, plus "kivy":
+    whether the import pulled in any part of Kivy.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (here, os.environ.get("PYTHONPATH")))))
+    latencies = []
+    kivy = False
+    for _ in range(reps):
+        output = subprocess.run([sys.executable, "-c", _IMPORT_PROBE.format(module=module)],
+                                capture_output=True, text=True, check=True, cwd=here, env=env).stdout.split()
+        latencies.append(float(output[0]))
+        kivy = kivy or output[1] == "True"
+    total = sum(latencies)
+    latencies.sort()
+    return {
+        "ops_per_sec": len(latencies) / total if total else float("inf"),
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "reps": len(latencies),
+        "kivy": kivy,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Return (name, ops/sec now, ops/sec before) for every case more than `threshold` slower."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before and result["ops_per_sec"] < before["ops_per_sec"] * (1 - threshold):
+            regressions.append((name, result["ops_per_sec"], before["ops_per_sec"]))
+    return regressions
+
+
+def _number_list(text, kind):
+    try:
+        return [kind(part) for part in text.split(",") if part]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a comma-separated list, got {text!r}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmark", description="Benchmark the puzzle generators and helpers.")
+    parser.add_argument("--sizes", type=lambda text: _number_list(text, int), default=[10, 100, 1000],
+                        help="comma-separated square puzzle sizes (default 10,100,1000)")
+    parser.add_argument("--densities", type=lambda text: _number_list(text, float), default=[0.5],
+                        help="comma-separated densities (default 0.5)")
+    parser.add_argument("--batch-sizes", type=lambda text: _number_list(text, int), default=[100, 1000],
+                        help="comma-separated batch sizes for the NumPy cases (default 100,1000)")
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds to spend timing each case")
+    parser.add_argument("--max-reps", type=int, default=1000, help="most timed runs per case")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare against results saved with --json")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="fraction of ops/sec a case may lose against the baseline (default 0.2)")
+    args = parser.parse_args(argv)
+
+    results = {}
+    print(f"{'case':<40} {'ops/sec':>12} {'p50 ms':>10} {'p99 ms':>10} {'peak KiB':>10}")
+    for name, setup in cases(args.sizes, args.densities, args.batch_sizes):
+        if args.filter not in name:
+            continue
+        result = measure(setup(), args.min_time, max_reps=args.max_reps)
+        results[name] = result
+        print(f"{name:<40} {result['ops_per_sec']:>12.2f} {result['p50_ms']:>10.3f} "
+              f"{result['p99_ms']:>10.3f} {result['peak_kib']:>10.1f}", flush=True)
+    gui_imports = []
+    for module in CORE_MODULES:
+        name = f"import/{module}"
+        if args.filter not in name:
+            continue
+        result = measure_import(module)
+        results[name] = result
+        print(f"{name:<40} {result['ops_per_sec']:>12.2f} {result['p50_ms']:>10.3f} "
+              f"{result['p99_ms']:>10.3f} {'-':>10}", flush=True)
+        if result["kivy"]:
+            gui_imports.append(module)
+
+    if args.json:
+        report = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "results": results,
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for name, now, before in regressions:
+            print(f"REGRESSION {name}: {now:.2f} ops/sec, was {before:.2f} ({now / before - 1:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No case is more than {args.threshold:.0%} slower than {args.baseline}")
+    if gui_imports:
+        sys.exit(f"These core modules import Kivy: {', '.join(gui_imports)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import functools
+import io
+import sys
+import threading
+import time
+from collections import namedtuple
+
+# Optional counters and timing spans for the solvers and generators. Nothing
+# is recorded until enable() is called. While disabled, a counter hook in the
+# core modules costs one check of `enabled` and a timed function one extra
+# call, so the hooks can stay in place in production code. cProfile,
+# tracemalloc, signal and json are only imported when asked for, which keeps
+# importing the core modules fast.
+#
+#   import instrumentation
+#   instrumentation.enable(profile=True)
+#   generate_nonogram(30, 30, unique=True)
+#   instrumentation.dump()
+
+enabled = False
+
+# Time spent in one named phase: number of calls, total and longest seconds
+SpanStats = namedtuple("SpanStats", "calls total max")
+# counters and spans are dicts keyed by name; line_cache is a dict of the
+# shared line cache's hits, misses, size and maxsize; profile is the text of
+# a pstats report and memory a dict of current and peak bytes plus the top
+# allocation sites, or None when they were not captured
+Stats = namedtuple("Stats", "counters spans line_cache profile memory")
+
+_lock = threading.Lock()
+_counters = {}
+_spans = {}
+_profiler = None
+_tracing_memory = False
+_memory = None  # (current, peak, snapshot) kept when tracing stops
+_cache_start = None
+
+
+def _line_cache_info():
+    # Imported here because nonogram_solver reports to this module
+    import nonogram_solver
+    return nonogram_solver.line_cache, nonogram_solver.line_cache.cache_info()
+
+
+def enable(profile=False, memory=False):
+    """Start recording counters and spans, dropping anything recorded earlier.
+
+    With `profile`, the calling thread also runs under cProfile; with
+    `memory`, allocations are traced with tracemalloc.
+    """
+    global enabled, _profiler, _tracing_memory
+    disable()
+    _profiler = None
+    if profile:
+        import cProfile
+        _profiler = cProfile.Profile()
+    if memory:
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_memory = True
+    reset()
+    if _profiler is not None:
+        _profiler.enable()
+    enabled = True
+
+
+def disable():
+    """Stop recording. What has been recorded so far stays available to stats()."""
+    global enabled, _tracing_memory, _memory
+    enabled = False
+    if _profiler is not None:
+        _profiler.disable()
+    if _tracing_memory:
+        import tracemalloc
+        _memory = tracemalloc.get_traced_memory() + (tracemalloc.take_snapshot(),)
+        tracemalloc.stop()
+        _tracing_memory = False
+
+
+def reset():
+    """Clear everything recorded so far without changing what is being recorded."""
+    global _cache_start, _profiler, _memory
+    with _lock:
+        _counters.clear()
+        _spans.clear()
+    if _profiler is not None:
+        import cProfile
+        _profiler.disable()
+        _profiler = cProfile.Profile()
+        if enabled:
+            _profiler.enable()
+    _memory = None
+    if _tracing_memory:
+        import tracemalloc
+        tracemalloc.clear_traces()
+        tracemalloc.reset_peak()
+    _cache_start = _line_cache_info()
+
+
+def count(name, n=1):
+    """Add `n` to the counter `name`. Callers check `enabled` first."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def _record(name, elapsed):
+    with _lock:
+        calls, total, longest = _spans.get(name, (0, 0.0, 0.0))
+        _spans[name] = SpanStats(calls + 1, total + elapsed, max(longest, elapsed))
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.name, time.perf_counter() - self.start)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name):
+    """Context manager timing the block under `name`; does nothing while disabled."""
+    return _Span(name) if enabled else _NULL_SPAN
+
+
+def timed(name):
+    """Decorator timing every call of a function under `name`."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def percentile(sorted_values, fraction):
+    """The value at `fraction` (0 to 1) of the way through a sorted, non-empty list of samples."""
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def stats(top=20):
+    """Snapshot everything recorded since enable() or reset() as a Stats.
+
+    Line cache hits and misses only count lookups made since then, provided
+    the shared cache has not been replaced in between. `top` limits the
+    profile report and the list of allocation sites.
+    """
+    with _lock:
+        counters = dict(_counters)
+        spans = dict(_spans)
+
+    cache, info = _line_cache_info()
+    hits, misses = info.hits, info.misses
+    if _cache_start is not None and _cache_start[0] is cache:
+        hits -= _cache_start[1].hits
+        misses -= _cache_start[1].misses
+    line_cache = {"hits": hits, "misses": misses, "size": info.currsize, "maxsize": info.maxsize}
+
+    profile = None
+    if _profiler is not None:
+        import pstats
+        if enabled:
+            _profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(_profiler, stream=out).sort_stats("cumulative").print_stats(top)
+        profile = out.getvalue()
+        if enabled:
+            _profiler.enable()
+
+    memory = None
+    if _tracing_memory:
+        import tracemalloc
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+    elif _memory is not None:
+        current, peak, snapshot = _memory
+    if _tracing_memory or _memory is not None:
+        sites = snapshot.statistics("lineno")[:top]
+        memory = {
+            "current": current,
+            "peak": peak,
+            "top": [{"site": f"{site.traceback[0].filename}:{site.traceback[0].lineno}",
+                     "size": site.size, "count": site.count} for site in sites],
+        }
+    return Stats(counters, spans, line_cache, profile, memory)
+
+
+def dump(file=None, format="text", top=20):
+    """Write stats() to `file` (default stderr) as a text report or as JSON."""
+    if file is None:
+        file = sys.stderr
+    snapshot = stats(top)
+    if format == "json":
+        import json
+        record = snapshot._asdict()
+        record["spans"] = {name: entry._asdict() for name, entry in snapshot.spans.items()}
+        json.dump(record, file, indent=2)
+        file.write("\n")
+        return
+
+    lines = ["counters:"]
+    for name, value in sorted(snapshot.counters.items()):
+        lines.append(f"  {name:<32} {value:>12}")
+    lines.append(f"spans:{'calls':>33} {'total ms':>12} {'max ms':>10}")
+    for name, (calls, total, longest) in sorted(snapshot.spans.items(), key=lambda item: -item[1].total):
+        lines.append(f"  {name:<32} {calls:>5} {total * 1000:>12.3f} {longest * 1000:>10.3f}")
+    cache = snapshot.line_cache
+    lines.append(f"line cache: {cache['hits']} hits, {cache['misses']} misses, "
+                 f"{cache['size']}/{cache['maxsize']} entries")
+    if snapshot.memory is not None:
+        memory = snapshot.memory
+        lines.append(f"memory: {memory['current'] / 1024:.1f} KiB now, {memory['peak'] / 1024:.1f} KiB peak")
+        for site in memory["top"]:
+            lines.append(f"  {site['site']:<60} {site['size'] / 1024:>10.1f} KiB {site['count']:>8}")
+    if snapshot.profile is not None:
+        lines.append("profile:")
+        lines.append(snapshot.profile)
+    file.write("\n".join(lines) + "\n")
+
+
+def dump_on_signal(signum=None, file=None, format="text"):
+    """Dump the stats whenever the process receives `signum` (default SIGUSR1).
+
+    Lets a long generation run be inspected without stopping it, e.g. with
+    `kill -USR1 <pid>`. Not available on Windows, which has no SIGUSR1.
+    """
+    import signal
+    if signum is None:
+        signum = signal.SIGUSR1
+    signal.signal(signum, lambda *_: dump(file, format))
@@ -1,12 +1,21 @@
+import argparse
+import itertools
+from array import array
+import json
+import os
 import random
+import sys
 
-def generate_structured_grid(height, width, density=0.5):
+import instrumentation
+from nonogram_solver import count_solutions, solve_nonogram
+
+def generate_structured_grid(height, width, density=0.5, rng=random):
     grid = [[0 for _ in range(width)] for _ in range(height)]
     
     # Fill grid with random patterns based on density
     for i in range(height):
         for j in range(width):
-            grid[i][j] = 1 if random.random() < density else 0
+            grid[i][j] = 1 if rng.random() < density else 0
 
     return grid
 
@@ -24,11 +33,92 @@ def calculate_clues(line):
         clues.append(count)
     return clues or [0]
 
-def generate_nonogram(height, width, density=0.5):
-    grid = generate_structured_grid(height, width, density)
+def calculate_clues_from_bits(bits):
+    # Same clues as calculate_clues for a line stored as a bitmask (bit j = cell j)
+    clues = []
+    while bits:
+        bits >>= (bits & -bits).bit_length() - 1  # skip to the next run
+        run = (~bits & (bits + 1)).bit_length() - 1  # length of the trailing ones
+        clues.append(run)
+        bits >>= run
+    return clues or [0]
+
+@instrumentation.timed("generate_nonogram")
+def generate_nonogram(height, width, density=0.5, unique=False, max_attempts=50, rng=random):
+    if not unique:
+        grid = generate_structured_grid(height, width, density, rng)
+        row_clues = [calculate_clues(row) for row in grid]
+        column_clues = [calculate_clues([grid[r][c] for r in range(height)]) for c in range(width)]
+        return grid, row_clues, column_clues
+
+    # Keep drawing random grids until one can be repaired into a puzzle with a single solution
+    for _ in range(max_attempts):
+        grid = generate_structured_grid(height, width, density, rng)
+        clues = make_unique(grid, density=density, rng=rng)
+        if clues is not None:
+            return grid, clues[0], clues[1]
+        if instrumentation.enabled:
+            instrumentation.count("rejected_grids")
+    raise RuntimeError(f"Could not generate a unique {height}x{width} nonogram in {max_attempts} attempts")
+
+@instrumentation.timed("make_unique")
+def make_unique(grid, max_rounds=None, max_branches=None, density=None, tolerance=0.05, minimal=False,
+                rng=random):
+    # Repair an ambiguous grid in place until its clues have exactly one
+    # solution. Line logic finishing the puzzle proves uniqueness on its own.
+    # While it leaves many cells undecided, a tenth of them are flipped per
+    # round; once few are left, the bounded solution counter looks for two
+    # solutions and only cells where they disagree are flipped. Fills and
+    # clears are balanced to keep the fill at most `tolerance` (a fraction of
+    # all cells) above the target (`density`, or the grid's own fill if not
+    # given): filling is preferred up to that bound because it makes lines
+    # more constrained. With `minimal`, every round flips one cell the two
+    # solutions disagree on and keeps the fill where it is, which changes a
+    # picture as little as possible. Budgets grow with the grid: `max_rounds`
+    # defaults to height + width and `max_branches` to a quarter of the cells
+    # (at least 200). Returns (row_clues, column_clues), or None if the grid
+    # is rejected.
+    height, width = len(grid), len(grid[0])
+    if max_rounds is None:
+        max_rounds = height + width
+    if max_branches is None:
+        max_branches = max(200, height * width // 4)
+    filled = sum(map(sum, grid))
+    target = filled if density is None else density * height * width
+    if not minimal:
+        target += tolerance * height * width
     row_clues = [calculate_clues(row) for row in grid]
     column_clues = [calculate_clues([grid[r][c] for r in range(height)]) for c in range(width)]
-    return grid, row_clues, column_clues
+    for _ in range(max_rounds):
+        if instrumentation.enabled:
+            instrumentation.count("repair_rounds")
+        status, partial = solve_nonogram(row_clues, column_clues)
+        if status == "solved":
+            return row_clues, column_clues
+        candidates = [(r, c) for r in range(height) for c in range(width) if partial[r][c] == -1]
+        if minimal or len(candidates) <= max(height, width):
+            count, solutions = count_solutions(row_clues, column_clues, limit=2, max_branches=max_branches)
+            if count == 1:
+                return row_clues, column_clues
+            if count is None:
+                return None
+            first, second = solutions
+            candidates = [(r, c) for r, c in candidates if first[r][c] != second[r][c]]
+        flips = 1 if minimal else max(1, len(candidates) // 10)
+        # Net change in filled cells that moves the fill towards the target
+        net = max(-flips, min(flips, int(target - filled)))
+        empty = [(r, c) for r, c in candidates if not grid[r][c]]
+        full = [(r, c) for r, c in candidates if grid[r][c]]
+        fills = min(len(empty), (flips + net + 1) // 2)
+        clears = min(len(full), flips - fills)
+        # Top up with fills when there are too few filled cells to clear
+        fills = min(len(empty), flips - clears)
+        for r, c in rng.sample(empty, fills) + rng.sample(full, clears):
+            grid[r][c] = 1 - grid[r][c]
+            filled += 1 if grid[r][c] else -1
+            row_clues[r] = calculate_clues(grid[r])
+            column_clues[c] = calculate_clues([grid[i][c] for i in range(height)])
+    return None
 
 def validate_nonogram(grid, row_clues, column_clues):
     for i, row in enumerate(grid):
@@ -40,52 +130,461 @@ def validate_nonogram(grid, row_clues, column_clues):
             return False
     return True
 
-def display_nonogram(grid, row_clues, column_clues, empty=False):
+class ColumnClues:
+    # Column clues of a grid fed in one row at a time, for grids too large to
+    # hold in memory. Besides the finished runs, only the row where each
+    # column's current run started is kept, so the working state is O(width).
+    # Runs are stored in compact arrays (4 bytes each) since on a random grid
+    # they add up to about a quarter of the cells.
+    __slots__ = ("width", "rows", "previous", "starts", "runs")
+
+    def __init__(self, width):
+        self.width = width
+        self.rows = 0
+        self.previous = 0
+        self.starts = array("I", [0]) * width
+        self.runs = [array("I") for _ in range(width)]
+
+    def add_row(self, bits):
+        # Add the next row as a bitmask (bit j = cell j). Only the columns
+        # where a run starts or ends are visited.
+        row = self.rows
+        started = bin(bits & ~self.previous)[:1:-1]  # character j is column j
+        j = started.find("1")
+        while j >= 0:
+            self.starts[j] = row
+            j = started.find("1", j + 1)
+        ended = bin(self.previous & ~bits)[:1:-1]
+        j = ended.find("1")
+        while j >= 0:
+            self.runs[j].append(row - self.starts[j])
+            j = ended.find("1", j + 1)
+        self.previous = bits
+        self.rows += 1
+
+    def __iter__(self):
+        # Each column's clues as a list, like calculate_clues, counting runs
+        # still open at the last row added
+        open_runs = bin(self.previous)[:1:-1]
+        for j, runs in enumerate(self.runs):
+            clues = runs.tolist()
+            if j < len(open_runs) and open_runs[j] == "1":
+                clues.append(self.rows - self.starts[j])
+            yield clues or [0]
+
+    def to_list(self):
+        return list(self)
+
+def stream_nonogram(height, width, density=0.5, rng=random):
+    # Generate the same puzzle as generate_nonogram(height, width, density,
+    # rng=rng) without ever holding the grid. Returns (rows, columns): rows
+    # yields (row bitmask, row clues) one row at a time, and columns is a
+    # ColumnClues that holds the column clues once rows has been used up.
+    columns = ColumnClues(width)
+
+    def rows():
+        draw = rng.random
+        for _ in range(height):
+            # Same draws in the same order as generate_structured_grid
+            line = "".join(["1" if draw() < density else "0" for _ in range(width)])
+            bits = int(line[::-1], 2)
+            columns.add_row(bits)
+            yield bits, [len(run) for run in line.split("0") if run] or [0]
+
+    return rows(), columns
+
+class Nonogram:
+    # Compact puzzle: the whole grid is one integer with row i stored as the
+    # bitmask in bits [i*width, (i+1)*width), plus a transposed copy with
+    # column j in bits [j*height, (j+1)*height). Clues are derived from the
+    # bits on demand instead of being stored, so a puzzle costs a few dozen
+    # bytes instead of one Python object per cell and per clue.
+    __slots__ = ("height", "width", "bits", "column_bits")
+
+    def __init__(self, height, width, bits, column_bits=None):
+        self.height = height
+        self.width = width
+        self.bits = bits
+        if column_bits is None:
+            column_bits = 0
+            remaining = bits
+            while remaining:
+                low = remaining & -remaining
+                remaining ^= low
+                r, c = divmod(low.bit_length() - 1, width)
+                column_bits |= 1 << (c * height + r)
+        self.column_bits = column_bits
+
+    @classmethod
+    def from_grid(cls, grid):
+        height, width = len(grid), len(grid[0])
+        bits = 0
+        column_bits = 0
+        for r, row in enumerate(grid):
+            for c, cell in enumerate(row):
+                if cell:
+                    bits |= 1 << (r * width + c)
+                    column_bits |= 1 << (c * height + r)
+        return cls(height, width, bits, column_bits)
+
+    @classmethod
+    def from_tuple(cls, puzzle):
+        # Accepts the (grid, row_clues, column_clues) tuple from generate_nonogram
+        return cls.from_grid(puzzle[0])
+
+    def row(self, r):
+        return (self.bits >> (r * self.width)) & ((1 << self.width) - 1)
+
+    def column(self, c):
+        return (self.column_bits >> (c * self.height)) & ((1 << self.height) - 1)
+
+    def cell(self, r, c):
+        return (self.bits >> (r * self.width + c)) & 1
+
+    def row_clues(self):
+        return [calculate_clues_from_bits(self.row(r)) for r in range(self.height)]
+
+    def column_clues(self):
+        return [calculate_clues_from_bits(self.column(c)) for c in range(self.width)]
+
+    def validate(self, row_clues, column_clues):
+        if len(row_clues) != self.height or len(column_clues) != self.width:
+            return False
+        for r, clue in enumerate(row_clues):
+            if calculate_clues_from_bits(self.row(r)) != clue:
+                return False
+        for c, clue in enumerate(column_clues):
+            if calculate_clues_from_bits(self.column(c)) != clue:
+                return False
+        return True
+
+    def to_grid(self):
+        return [[(self.bits >> (r * self.width + c)) & 1 for c in range(self.width)] for r in range(self.height)]
+
+    def to_tuple(self):
+        # The (grid, row_clues, column_clues) tuple display_nonogram and the Kivy apps work with
+        return self.to_grid(), self.row_clues(), self.column_clues()
+
+    def __eq__(self, other):
+        if not isinstance(other, Nonogram):
+            return NotImplemented
+        return self.height == other.height and self.width == other.width and self.bits == other.bits
+
+    def __hash__(self):
+        return hash((self.height, self.width, self.bits))
+
+    def __repr__(self):
+        return f"Nonogram({self.height}, {self.width}, {self.bits:#x})"
+
+class ProgressTracker:
+    # Player progress for the Kivy apps, updated per cell change instead of
+    # rescanning the board. Cell states follow NonogramCell: 0 unshaded,
+    # 1 shaded, 2 X. Correct/incorrect counts use the same rules as the old
+    # check_progress scan; the satisfied flags compare each line's shaded
+    # cells against its clue (via a row/column bitmask), so they also accept
+    # a valid answer that differs from the stored solution.
+    def __init__(self, solution_grid, row_clues, column_clues):
+        self.solution_grid = solution_grid
+        self.row_clues = row_clues
+        self.column_clues = column_clues
+        self.height = len(solution_grid)
+        self.width = len(solution_grid[0])
+        self.states = [[0] * self.width for _ in range(self.height)]
+        self.total_correct = sum(sum(row) for row in solution_grid)
+        self.correct_count = 0
+        self.incorrect_count = 0
+        self.row_bits = [0] * self.height
+        self.column_bits = [0] * self.width
+        self.row_satisfied = [clue == [0] for clue in row_clues]
+        self.column_satisfied = [clue == [0] for clue in column_clues]
+        self.satisfied_rows = sum(self.row_satisfied)
+        self.satisfied_columns = sum(self.column_satisfied)
+
+    def _score(self, row, col, state):
+        # (correct, incorrect) contribution of one cell in the given state
+        if self.solution_grid[row][col] == 1:
+            if state == 1:
+                return 1, 0
+            if state == 2:
+                return 0, 1  # X-ed when it should be shaded
+            return 0, 0
+        if state == 1:
+            return 0, 1  # Shaded when it should be unshaded
+        return 0, 0
+
+    def set_state(self, row, col, state):
+        old_state = self.states[row][col]
+        if old_state == state:
+            return
+        self.states[row][col] = state
+
+        old_correct, old_incorrect = self._score(row, col, old_state)
+        new_correct, new_incorrect = self._score(row, col, state)
+        self.correct_count += new_correct - old_correct
+        self.incorrect_count += new_incorrect - old_incorrect
+
+        if (old_state == 1) != (state == 1):
+            self.row_bits[row] ^= 1 << col
+            self.column_bits[col] ^= 1 << row
+            satisfied = calculate_clues_from_bits(self.row_bits[row]) == self.row_clues[row]
+            self.satisfied_rows += satisfied - self.row_satisfied[row]
+            self.row_satisfied[row] = satisfied
+            satisfied = calculate_clues_from_bits(self.column_bits[col]) == self.column_clues[col]
+            self.satisfied_columns += satisfied - self.column_satisfied[col]
+            self.column_satisfied[col] = satisfied
+
+    def is_solved(self):
+        return self.satisfied_rows == self.height and self.satisfied_columns == self.width
+
+    def summary(self):
+        text = f"Correctly shaded cells: {self.correct_count} / {self.total_correct} | Incorrectly shaded cells: {self.incorrect_count}"
+        if self.is_solved():
+            text += " | Solved!"
+        return text
+
+def format_nonogram(grid, row_clues, column_clues, empty=False):
+    # Same layout display_nonogram has always printed, built as one string
     # Calculate the maximum number of digits required for any clue
-    max_clue_digit_len = max(max(len(str(num)) for num in clue) for clue in row_clues + column_clues)
+    max_clue = max(max(clue) for clue in row_clues + column_clues)
+    max_clue_digit_len = len(str(max_clue))
     
     # Anticipate up to 4-digit clues, adjust format accordingly
     cell_width = max(max_clue_digit_len, 4)  # Ensure cell_width is at least 4
     format_str = f"{{:>{cell_width}}}"
 
-    # Square character
-    filled_square = "■"
-    empty_square = "□"
+    # Squares and clue numbers are padded once rather than for every cell;
+    # the entry after the largest clue is the blank under a short column clue
+    filled_square = format_str.format("■")
+    empty_square = format_str.format("□")
+    padded = [format_str.format(num) for num in range(max_clue + 1)] + [" " * cell_width]
 
-    # Calculate the maximum number of clues in any row or column
+    # Calculate the maximum number of clues in any row
     max_row_clue_len = max(len(clue) for clue in row_clues)
-    max_col_clue_len = max(len(clue) for clue in column_clues)
-
-    # Print column clues with appropriate padding and offset by one space
-    for i in range(max_col_clue_len):
-        # Padding for row clues with one additional space
-        print(" " * ((max_row_clue_len * cell_width) + 3), end=" ")
-        for clue in column_clues:
-            # Print the clue if it exists, else print an empty space
-            if len(clue) > i:
-                print(f"{format_str.format(clue[i])}", end="")
-            else:
-                print(" " * cell_width, end="")
-        print()
-
-    # Print each row with its clues, offsetting by one space
+
+    lines = []
+    # Column clues with appropriate padding and offset by one space
+    indent = " " * ((max_row_clue_len * cell_width) + 4)
+    for level in itertools.zip_longest(*column_clues, fillvalue=max_clue + 1):
+        lines.append(indent + "".join(map(padded.__getitem__, level)))
+
+    # Each row with its clues, offsetting by one space
+    row_clue_width = max_row_clue_len * cell_width
+    blank_row = empty_square * len(column_clues)
+    squares = (empty_square, filled_square)
     for row_clue, row in zip(row_clues, grid):
-        # Align row clues and grid cells
-        row_clue_str = " " + "".join(format_str.format(clue) for clue in row_clue).rjust(max_row_clue_len * cell_width)
-        grid_row_str = "".join(format_str.format(filled_square if cell else empty_square) if not empty else format_str.format(empty_square) for cell in row)
-        print(f"{row_clue_str} | {grid_row_str}")
+        row_clue_str = "".join(map(padded.__getitem__, row_clue)).rjust(row_clue_width)
+        grid_row_str = blank_row if empty else "".join(map(squares.__getitem__, row))
+        lines.append(f" {row_clue_str} | {grid_row_str}")
+    lines.append("")
+    return "\n".join(lines)
+
+def display_nonogram(grid, row_clues, column_clues, empty=False, file=None):
+    (file or sys.stdout).write(format_nonogram(grid, row_clues, column_clues, empty))
+
+def display_nonograms(puzzles, empty=False, file=None, batch_size=256):
+    # Print many (grid, row_clues, column_clues) puzzles separated by blank
+    # lines, handing the stream one large write per batch of puzzles
+    out = file or sys.stdout
+    batch = []
+    for grid, row_clues, column_clues in puzzles:
+        batch.append(format_nonogram(grid, row_clues, column_clues, empty))
+        if len(batch) >= batch_size:
+            out.write("\n".join(batch) + "\n")
+            batch = []
+    if batch:
+        out.write("\n".join(batch) + "\n")
+
+def _generate_item(task):
+    # Process pool worker for the generate command. Every item gets its own
+    # seed derived from the run seed and its index, so any item can be
+    # regenerated on its own and an interrupted run can be resumed.
+    index, seed, height, width, density, unique, level = task
+    item_seed = f"{seed}:{index}"
+    rng = random.Random(item_seed)
+    record = {"index": index, "seed": item_seed, "height": height, "width": width}
+    try:
+        if level:
+            # Imported here because nonogram_difficulty builds on this module
+            from nonogram_difficulty import generate_graded_nonogram
+            grid, row_clues, column_clues, grade = generate_graded_nonogram(height, width, level, density, rng=rng)
+            record["level"] = grade.level
+            record["score"] = grade.score
+        else:
+            grid, row_clues, column_clues = generate_nonogram(height, width, density, unique=unique, rng=rng)
+    except RuntimeError as exc:
+        record["error"] = str(exc)
+        return record
+    record["grid"] = grid
+    record["row_clues"] = row_clues
+    record["column_clues"] = column_clues
+    record["valid"] = validate_nonogram(grid, row_clues, column_clues)
+    return record
+
+def _count_complete_lines(path):
+    # Number of finished records in an existing output file; a partially
+    # written last line (from an interrupted run) is cut off so it gets redone
+    if not os.path.exists(path):
+        return 0
+    lines = 0
+    end = 0
+    offset = 0
+    with open(path, "rb+") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            newlines = block.count(b"\n")
+            if newlines:
+                lines += newlines
+                end = offset + block.rfind(b"\n") + 1
+            offset += len(block)
+        if end < offset:
+            f.truncate(end)
+    return lines
 
-# Example usage
-height, width = 10, 10
-grid, row_clues, column_clues = generate_nonogram(height, width, density=0.5)
+def parse_size(text):
+    # argparse type for sizes written as HxW, or N for a square
+    height, _, width = text.lower().partition("x")
+    try:
+        height, width = int(height), int(width or height)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"size must look like HxW, got {text!r}")
+    if height < 1 or width < 1:
+        raise argparse.ArgumentTypeError(f"size must be positive, got {text!r}")
+    return height, width
 
-if validate_nonogram(grid, row_clues, column_clues):
-    print("Generated nonogram is valid!\n")
+def generate_command(args):
+    height, width = args.size
+    if args.stats:
+        instrumentation.enable()
+    start = args.start
+    if args.resume:
+        if not args.output:
+            sys.exit("--resume needs --output")
+        start += _count_complete_lines(args.output)
+    end = args.start + args.count
+    if args.output:
+        out = open(args.output, "a" if args.resume else "w", encoding="utf-8")
+    else:
+        # With --library and no --output the puzzles only go to the library
+        out = None if args.library else sys.stdout
+    library = None
+    if args.library:
+        # Imported here because nonogram_library builds on this module
+        from nonogram_library import PuzzleLibrary, pack_record
+        library = PuzzleLibrary(args.library, "a")
+
+    # Tasks are handed to the pool one window at a time so memory stays
+    # bounded no matter how large --count is; imap keeps the output in index
+    # order, which makes runs reproducible line for line.
+    chunksize = max(1, args.chunksize)
+    window = args.workers * chunksize * 4
+    # Imported here so that importing this module for its puzzle functions stays fast
+    import multiprocessing
+    pool = multiprocessing.Pool(args.workers) if args.workers > 1 else None
+    try:
+        for window_start in range(start, end, window):
+            tasks = [(index, args.seed, height, width, args.density, args.unique, args.level)
+                     for index in range(window_start, min(end, window_start + window))]
+            results = pool.imap(_generate_item, tasks, chunksize) if pool else map(_generate_item, tasks)
+            packed = []
+            for record in results:
+                if out:
+                    out.write(json.dumps(record, separators=(",", ":")) + "\n")
+                if library and "error" not in record:
+                    packed.append(pack_record(record["grid"], record["row_clues"], record["column_clues"],
+                                              record["seed"], record.get("level")))
+            if out:
+                out.flush()
+            if packed:
+                library.append_records(packed)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+        if out and out is not sys.stdout:
+            out.close()
+        if library:
+            library.close()
+        if args.stats:
+            instrumentation.disable()
+            instrumentation.dump()
+
+def stream_command(args):
+    # One puzzle written as a generate record piece by piece, so a
+    # 10000x10000 poster puzzle never sits in memory. Row clues are only
+    # known row by row but come after the grid in the record, so they wait in
+    # a temporary file.
+    # Imported here so that importing this module for its puzzle functions stays fast
+    import tempfile
+    height, width = args.size
+    rows, columns = stream_nonogram(height, width, args.density, random.Random(args.seed))
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        with tempfile.TemporaryFile("w+", encoding="utf-8") as row_clues:
+            out.write(json.dumps({"seed": args.seed, "height": height, "width": width}, separators=(",", ":"))[:-1]
+                      + ',"grid":[')
+            for i, (bits, clues) in enumerate(rows):
+                line = format(bits, f"0{width}b")[::-1]
+                out.write(("," if i else "") + "[" + ",".join(line) + "]")
+                row_clues.write(("," if i else "") + json.dumps(clues, separators=(",", ":")))
+            out.write('],"row_clues":[')
+            row_clues.seek(0)
+            for block in iter(lambda: row_clues.read(1 << 20), ""):
+                out.write(block)
+            out.write('],"column_clues":[')
+            for j, clues in enumerate(columns):
+                out.write(("," if j else "") + json.dumps(clues, separators=(",", ":")))
+            out.write("]}\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+def example_command(args):
+    # Example usage
+    height, width = 10, 10
+    grid, row_clues, column_clues = generate_nonogram(height, width, density=0.5)
+
+    if validate_nonogram(grid, row_clues, column_clues):
+        print("Generated nonogram is valid!\n")
     
-    print("Solved Nonogram:\n")
-    display_nonogram(grid, row_clues, column_clues)
+        print("Solved Nonogram:\n")
+        display_nonogram(grid, row_clues, column_clues)
     
-    print("\nBlank Nonogram (for printing):\n")
-    display_nonogram(grid, row_clues, column_clues, empty=True)
-else:
-    print("Generated nonogram is invalid.")
+        print("\nBlank Nonogram (for printing):\n")
+        display_nonogram(grid, row_clues, column_clues, empty=True)
+    else:
+        print("Generated nonogram is invalid.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="nonogram", description="Generate nonogram puzzles.")
+    subparsers = parser.add_subparsers(dest="command")
+    generate = subparsers.add_parser("generate", help="generate puzzles as JSON lines")
+    generate.add_argument("--count", type=int, default=1, help="number of puzzles to generate")
+    generate.add_argument("--size", type=parse_size, default=(10, 10), help="puzzle size as HxW (default 10x10)")
+    generate.add_argument("--density", type=float, default=0.5, help="chance of a cell being filled")
+    generate.add_argument("--unique", action="store_true", help="only emit puzzles with exactly one solution")
+    generate.add_argument("--level", choices=("easy", "medium", "hard", "expert"),
+                          help="only emit unique puzzles of this difficulty (implies --unique)")
+    generate.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    generate.add_argument("--chunksize", type=int, default=16, help="puzzles handed to a worker at a time")
+    generate.add_argument("--seed", default="0", help="run seed; item i uses seed 'SEED:i'")
+    generate.add_argument("--start", type=int, default=0, help="index of the first puzzle")
+    generate.add_argument("--output", help="write to this file instead of stdout")
+    generate.add_argument("--resume", action="store_true", help="skip puzzles already in --output and append")
+    generate.add_argument("--library", help="also append the puzzles to this puzzle library directory")
+    generate.add_argument("--stats", action="store_true",
+                          help="print solver counters and timings to stderr when done "
+                               "(covers this process only, so use --workers 1 to include generation)")
+    generate.set_defaults(func=generate_command)
+    stream = subparsers.add_parser("stream", help="generate one very large puzzle without holding it in memory")
+    stream.add_argument("--size", type=parse_size, default=(1000, 1000), help="puzzle size as HxW (default 1000x1000)")
+    stream.add_argument("--density", type=float, default=0.5, help="chance of a cell being filled")
+    stream.add_argument("--seed", default="0", help="random seed")
+    stream.add_argument("--output", help="write to this file instead of stdout")
+    stream.set_defaults(func=stream_command)
+    args = parser.parse_args(argv)
+    if args.command is None:
+        example_command(args)
+    else:
+        args.func(args)
+
+if __name__ == "__main__":
+    main()
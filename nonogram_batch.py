@@ -0,0 +1,195 @@
+import itertools
+from collections import namedtuple
+
+import numpy as np
+
+# Batch versions of the nonogram.py helpers for jobs that need thousands or
+# millions of puzzles. Grids are generated as one boolean array and clues come
+# out in the same list-of-lists format as calculate_clues ([0] for a blank line).
+
+
+def generate_grids(count, height, width, density=0.5, rng=None):
+    """Generate `count` random grids as a boolean array of shape (count, height, width)."""
+    rng = np.random.default_rng(rng)
+    return rng.random((count, height, width)) < density
+
+
+def _runs(lines):
+    # Runs of every line of a 2D array: (line of each run, run lengths, runs
+    # per line), runs in row-major order
+    lines = np.asarray(lines, dtype=bool)
+    n_lines, length = lines.shape
+    # Lay the lines end to end with an empty cell before each one and one at
+    # the very end; every run then starts and ends with a change of value,
+    # and the changes alternate between starts and ends
+    flat = np.zeros(n_lines * (length + 1) + 1, dtype=bool)
+    flat[:-1].reshape(n_lines, length + 1)[:, 1:] = lines
+    changes = np.flatnonzero(flat[1:] != flat[:-1])
+    starts, ends = changes[0::2], changes[1::2]
+    start_lines = starts // (length + 1)
+    return start_lines, ends - starts, np.bincount(start_lines, minlength=n_lines)
+
+
+def line_clues(lines):
+    """Run-length encode every line of a 2D array into calculate_clues-style clues."""
+    _, lengths, counts = _runs(lines)
+    lengths = lengths.tolist()
+    bounds = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=bounds[1:])
+    bounds = bounds.tolist()
+    return [lengths[start:end] or [0] for start, end in zip(bounds, bounds[1:])]
+
+
+def batch_clues(grids):
+    """Return (row_clues, column_clues) for every grid in a (count, height, width) array.
+
+    row_clues[k] and column_clues[k] are the clue lists of grid k, exactly as
+    generate_nonogram would build them.
+    """
+    grids = _grid_array(grids)
+    if not grids.size and grids.ndim < 3:
+        # An empty list of grids; there is nothing to check
+        grids = grids.reshape(0, 0, 0)
+    count, height, width = grids.shape
+    rows = line_clues(grids.reshape(count * height, width))
+    columns = line_clues(grids.transpose(0, 2, 1).reshape(count * width, height))
+    row_clues = [rows[k * height:(k + 1) * height] for k in range(count)]
+    column_clues = [columns[k * width:(k + 1) * width] for k in range(count)]
+    return row_clues, column_clues
+
+
+def generate_nonograms(count, height, width, density=0.5, rng=None):
+    """Batch counterpart of generate_nonogram.
+
+    Returns (grids, row_clues, column_clues) where grids is the boolean array
+    from generate_grids; `grids[k].astype(int).tolist()` gives the usual
+    list-of-lists grid for puzzle k.
+    """
+    grids = generate_grids(count, height, width, density, rng)
+    row_clues, column_clues = batch_clues(grids)
+    return grids, row_clues, column_clues
+
+
+def pack_clues(clue_sets, length):
+    """Pack the clues of many puzzles into an array for validate_batch.
+
+    clue_sets[k] is the list of row (or column) clues of puzzle k in
+    calculate_clues format and `length` the length of those lines (the grid
+    width for row clues, the height for column clues). The result has shape
+    (count, lines, (length + 1) // 2 + 1): the number of runs of each line
+    followed by their lengths, padded with zeros. The clues are flattened in
+    one pass and placed with NumPy, but reading the Python lists is still
+    most of the cost of validating packed grids; a service that checks many
+    submissions of the same puzzles should pack their clues once and keep
+    the array.
+    """
+    count = len(clue_sets)
+    n_lines = len(clue_sets[0]) if count else 0
+    if any(len(clues) != n_lines for clues in clue_sets):
+        raise ValueError("every puzzle needs the same number of clues")
+    lines = list(itertools.chain.from_iterable(clue_sets))
+    sizes = np.fromiter(map(len, lines), dtype=np.intp, count=len(lines))
+    runs = list(itertools.chain.from_iterable(lines))
+    # bytes() reads a list of small ints faster than any NumPy constructor.
+    # It rejects values outside 0-255, so long runs and malformed clues take
+    # the slow path and are reported as bad lines rather than crashing the
+    # validation (checking min() and max() first would cost more than bytes())
+    try:
+        values = np.frombuffer(bytes(runs), dtype=np.uint8)
+    except (TypeError, ValueError):
+        values = np.array(runs, dtype=np.int64)
+    first = np.cumsum(sizes) - sizes
+    # [0] is a blank line, which has no runs
+    counts = sizes.copy()
+    listed = sizes > 0
+    counts[listed] -= values[first[listed]] == 0
+    # A line of `length` cells has at most (length + 1) // 2 runs. Longer
+    # clues can never match, and their run count alone says so
+    max_runs = (length + 1) // 2
+    table = np.zeros((len(lines), max_runs + 1), dtype=np.int32)
+    table[:, 0] = counts
+    rank = np.arange(len(values)) - np.repeat(first, sizes)
+    cells = np.repeat(np.arange(len(lines)) * (max_runs + 1), sizes) + rank + 1
+    if len(values) and sizes.max() > max_runs:
+        fits = rank < max_runs
+        cells, values = cells[fits], values[fits]
+    # The 0 of a blank line lands in the padding, which is 0 already
+    table.ravel()[cells] = values
+    return table.reshape(count, n_lines, max_runs + 1)
+
+
+def _grid_array(grids):
+    # Nested lists of 0 and 1 as a (count, height, width) boolean array.
+    # Going through bytes is about twice as fast as np.asarray on lists;
+    # anything else (ragged lists, values bytes() rejects) takes the slow path
+    if not isinstance(grids, np.ndarray) and len(grids) and len(grids[0]) and isinstance(grids[0], list):
+        height, width = len(grids[0]), len(grids[0][0])
+        rows = list(itertools.chain.from_iterable(grids))
+        if len(rows) == len(grids) * height and all(len(row) == width for row in rows):
+            try:
+                cells = np.frombuffer(b"".join(map(bytes, rows)), dtype=np.uint8)
+            except (TypeError, ValueError):
+                pass
+            else:
+                return (cells != 0).reshape(len(grids), height, width)
+    return np.asarray(grids, dtype=bool)
+
+
+def _bad_lines(lines, packed):
+    # Boolean array marking the lines of a 2D array whose runs differ from
+    # their packed clues, given as a 2D (line, count and runs) table
+    start_lines, lengths, counts = _runs(lines)
+    bad = counts != packed[:, 0]
+    # Where the counts differ the comparison below may read padding, but
+    # those lines are bad already
+    first = np.cumsum(counts) - counts
+    rank = np.arange(len(lengths)) - first[start_lines]
+    bad[start_lines[packed[start_lines, rank + 1] != lengths]] = True
+    return bad
+
+
+# valid is a boolean array with one entry per puzzle; bad_rows and
+# bad_columns are boolean arrays of shape (count, height) and (count, width)
+# marking the lines that do not match their clues
+BatchValidation = namedtuple("BatchValidation", "valid bad_rows bad_columns")
+
+
+def validate_batch(grids, row_clues, column_clues, all_lines=False):
+    """Check a stack of solutions against their clues; returns a BatchValidation.
+
+    `grids` is a (count, height, width) array (or nested lists). row_clues[k]
+    and column_clues[k] are the clues of grid k, either in calculate_clues
+    format or already packed with pack_clues; packed clues and a NumPy array
+    of grids skip the conversions that take most of the time. All rows are
+    checked at once; columns are then only checked for the puzzles whose
+    rows all matched, so a failed puzzle reports its bad rows but no bad
+    columns unless `all_lines` is set. `np.flatnonzero(result.bad_rows[k])` lists the bad
+    rows of puzzle k.
+    """
+    grids = _grid_array(grids)
+    if not grids.size and grids.ndim < 3:
+        # An empty list of grids; there is nothing to check
+        grids = grids.reshape(0, 0, 0)
+    count, height, width = grids.shape
+    if not isinstance(row_clues, np.ndarray):
+        row_clues = pack_clues(row_clues, width)
+    if not isinstance(column_clues, np.ndarray):
+        column_clues = pack_clues(column_clues, height)
+    if count and (row_clues.shape != (count, height, (width + 1) // 2 + 1) or
+                  column_clues.shape != (count, width, (height + 1) // 2 + 1)):
+        raise ValueError(f"clues do not fit {count} grids of {height}x{width}")
+
+    bad_rows = _bad_lines(grids.reshape(count * height, width),
+                          row_clues.reshape(count * height, row_clues.shape[-1])).reshape(count, height)
+    bad_columns = np.zeros((count, width), dtype=bool)
+    checked = np.arange(count) if all_lines else np.flatnonzero(~bad_rows.any(axis=1))
+    if len(checked) == count:
+        # Skip the copies that picking out puzzles would make
+        checked = slice(None)
+    n_checked = len(grids[checked])
+    if n_checked:
+        columns = grids[checked].transpose(0, 2, 1).reshape(n_checked * width, height)
+        packed = column_clues[checked].reshape(n_checked * width, column_clues.shape[-1])
+        bad_columns[checked] = _bad_lines(columns, packed).reshape(n_checked, width)
+    valid = ~(bad_rows.any(axis=1) | bad_columns.any(axis=1))
+    return BatchValidation(valid, bad_rows, bad_columns)
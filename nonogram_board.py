@@ -0,0 +1,317 @@
+from kivy.core.text import Label as CoreLabel
+from kivy.graphics import Color, InstructionGroup, Line, Rectangle
+from kivy.graphics.texture import Texture
+from kivy.properties import NumericProperty
+from kivy.uix.widget import Widget
+
+# Cell states, same as the old NonogramCell.cell_state
+UNSHADED = 0
+SHADED = 1
+CROSSED = 2
+
+# Pixels between the clues and the cells
+CLUE_GAP = 2
+# Smallest clue font; clues that don't fit at this size are drawn scaled down
+MIN_FONT_SIZE = 6
+# Font of the notice shown when the clues are scaled down
+NOTICE_FONT_SIZE = 11
+
+
+def default_cell_color(row, col, state):
+    if state == SHADED:
+        return (0.2, 0.2, 0.2, 1)
+    if state == CROSSED:
+        return (1, 1, 1, 1)
+    return (0.8, 0.8, 0.8, 1)
+
+
+def _rgba_bytes(color):
+    return bytes(int(round(channel * 255)) for channel in color)
+
+
+class NonogramBoard(Widget):
+    """Whole nonogram board (clues and cells) drawn on a single canvas.
+
+    Cell colours live in a texture with one texel per cell, scaled up with
+    nearest filtering, so the board costs the same handful of instructions
+    whatever its size. A click is mapped to a cell by arithmetic on the touch
+    position and only that cell's texel (and its X mark) is redrawn. Each
+    row's and column's clue is a single text texture, and the space around
+    the cells is sized from those textures. Clues that would not fit even at
+    the smallest font size are drawn scaled down until they fit, and a
+    notice in the corner above the row clues says so; `clue_scale` is the
+    factor they are drawn at (1 when they fit).
+
+    The board is reused across puzzles: the cell texture, grid lines, clue
+    rectangles and X marks are kept in pools and only the difference is
+    created or dropped when the puzzle size changes, and rendered clue
+    textures are cached by their text so repeated clues are not re-rendered.
+
+    Listen to cell changes with bind(on_cell_state=callback); the callback
+    gets (board, row, col, state).
+    """
+
+    __events__ = ("on_cell_state",)
+
+    clue_scale = NumericProperty(1)
+
+    def __init__(self, cell_color=default_cell_color, **kwargs):
+        super(NonogramBoard, self).__init__(**kwargs)
+        self.cell_color = cell_color
+        self.row_clues = []
+        self.column_clues = []
+        self.states = []
+        self.grid_height = 0
+        self.grid_width = 0
+        self.cell_size = 0
+        self.grid_x = 0
+        self.grid_top = 0
+        self._texture = None
+        self._clue_font_size = None
+        self._clue_textures = []
+        self._rendered = {}  # (text, font_size, halign) -> texture
+        self._crossed = {}  # (row, col) -> (group, line, line) drawing that cell's X
+        self._spare_crosses = []
+        self._line_pool = []
+        self._clue_pool = []
+
+        with self.canvas:
+            Color(1, 1, 1, 1)
+            self._cells_rect = Rectangle()
+        self._lines = InstructionGroup()
+        self._lines.add(Color(0, 0, 0, 1))
+        self._crosses = InstructionGroup()
+        self._clues = InstructionGroup()
+        self._clues.add(Color(1, 1, 1, 1))
+        self._notice = Rectangle(size=(0, 0))
+        self._clues.add(self._notice)
+        self.canvas.add(self._lines)
+        self.canvas.add(self._crosses)
+        self.canvas.add(self._clues)
+        self.bind(pos=self._layout, size=self._layout)
+
+    def set_puzzle(self, row_clues, column_clues):
+        """Show a new puzzle with every cell unshaded."""
+        self.row_clues = row_clues
+        self.column_clues = column_clues
+        self.grid_height = len(row_clues)
+        self.grid_width = len(column_clues)
+        self.states = [[UNSHADED] * self.grid_width for _ in range(self.grid_height)]
+        for cross in self._crossed.values():
+            self._crosses.remove(cross[0])
+            self._spare_crosses.append(cross)
+        self._crossed.clear()
+
+        texture = self._texture
+        if texture is None or texture.size != (self.grid_width, self.grid_height):
+            texture = Texture.create(size=(self.grid_width, self.grid_height), colorfmt="rgba")
+            texture.mag_filter = "nearest"
+            texture.min_filter = "nearest"
+        buf = bytearray()
+        # Texture rows start at the bottom of the board
+        for row in range(self.grid_height - 1, -1, -1):
+            for col in range(self.grid_width):
+                buf += _rgba_bytes(self.cell_color(row, col, UNSHADED))
+        texture.blit_buffer(bytes(buf), colorfmt="rgba", bufferfmt="ubyte")
+        self._texture = texture
+        self._cells_rect.texture = texture
+
+        self._clue_font_size = None
+        self._layout()
+
+    def set_cell_state(self, row, col, state):
+        if self.states[row][col] == state:
+            return
+        self.states[row][col] = state
+        self._texture.blit_buffer(_rgba_bytes(self.cell_color(row, col, state)),
+                                  pos=(col, self.grid_height - 1 - row), size=(1, 1),
+                                  colorfmt="rgba", bufferfmt="ubyte")
+        cross = self._crossed.pop((row, col), None)
+        if cross is not None:
+            self._crosses.remove(cross[0])
+            self._spare_crosses.append(cross)
+        if state == CROSSED:
+            cross = self._spare_crosses.pop() if self._spare_crosses else self._new_cross()
+            self._place_cross(cross, row, col)
+            self._crossed[(row, col)] = cross
+            self._crosses.add(cross[0])
+        self.canvas.ask_update()
+        self.dispatch("on_cell_state", row, col, state)
+
+    def on_cell_state(self, row, col, state):
+        pass
+
+    def cell_at(self, x, y):
+        """Return the (row, col) under a window position, or None outside the cells."""
+        if not self.cell_size:
+            return None
+        col = int((x - self.grid_x) // self.cell_size)
+        row = int((self.grid_top - y) // self.cell_size)
+        if 0 <= row < self.grid_height and 0 <= col < self.grid_width:
+            return row, col
+        return None
+
+    def on_touch_down(self, touch):
+        if self.collide_point(*touch.pos):
+            cell = self.cell_at(*touch.pos)
+            if cell is not None:
+                row, col = cell
+                self.set_cell_state(row, col, (self.states[row][col] + 1) % 3)
+                return True
+        return super(NonogramBoard, self).on_touch_down(touch)
+
+    def _layout(self, *args):
+        if not self.grid_height or not self.grid_width:
+            return
+        max_row_clues_len = max(len(clue) for clue in self.row_clues)
+        max_col_clues_len = max(len(clue) for clue in self.column_clues)
+
+        # First guess: row clues get one cell width per number, column clues
+        # half a cell height. The font has a minimum size, so the guess is
+        # then corrected with the size of the rendered clues; a different
+        # cell size can mean a different font, so this repeats a few times
+        cell_size = min(self.width / (self.grid_width + max_row_clues_len),
+                        self.height / (self.grid_height + max_col_clues_len / 2))
+        cell_size = max(1, int(cell_size))
+        for _ in range(3):
+            self._render_clues(max(MIN_FONT_SIZE, int(cell_size * 0.45)))
+            text_width, text_height, row_height, column_width = self._clue_extent()
+            clue_width = text_width + CLUE_GAP
+            clue_height = text_height + CLUE_GAP
+            fitted = max(1, int(min((self.width - clue_width) / self.grid_width,
+                                    (self.height - clue_height) / self.grid_height)))
+            if fitted == cell_size:
+                break
+            cell_size = fitted
+        scale = 1
+        if not (row_height <= cell_size and column_width <= cell_size and
+                clue_width + self.grid_width * cell_size <= self.width and
+                clue_height + self.grid_height * cell_size <= self.height):
+            # Even the smallest font is too big for the cells or the widget.
+            # Rather than drawing the clues over the board or past its edges,
+            # draw them scaled down so the tallest row clue and the widest
+            # column clue are one cell across, and size the cells for that
+            self._render_clues(MIN_FONT_SIZE)
+            text_width, text_height, row_height, column_width = self._clue_extent()
+            largest = max(row_height, column_width)
+            cell_size = max(1, int(min((self.width - CLUE_GAP) / (self.grid_width + text_width / largest),
+                                       (self.height - CLUE_GAP) / (self.grid_height + text_height / largest))))
+            scale = min(1, cell_size / largest)
+            clue_width = int(text_width * scale) + CLUE_GAP
+            clue_height = int(text_height * scale) + CLUE_GAP
+        self.clue_scale = scale
+        self.cell_size = cell_size
+        board_width = clue_width + self.grid_width * cell_size
+        board_height = clue_height + self.grid_height * cell_size
+        left = self.x + (self.width - board_width) // 2
+        top = self.top - (self.height - board_height) // 2
+        self.grid_x = left + clue_width
+        self.grid_top = top - clue_height
+        grid_bottom = self.grid_top - self.grid_height * cell_size
+        grid_right = self.grid_x + self.grid_width * cell_size
+
+        self._cells_rect.pos = (self.grid_x, grid_bottom)
+        self._cells_rect.size = (self.grid_width * cell_size, self.grid_height * cell_size)
+
+        lines = self._resize_pool(self._line_pool, self._lines, self.grid_height + self.grid_width + 2,
+                                  lambda: Line(width=1))
+        for row in range(self.grid_height + 1):
+            y = grid_bottom + row * cell_size
+            lines[row].points = [self.grid_x, y, grid_right, y]
+        for col in range(self.grid_width + 1):
+            x = self.grid_x + col * cell_size
+            lines[self.grid_height + 1 + col].points = [x, grid_bottom, x, self.grid_top]
+
+        for (row, col), cross in self._crossed.items():
+            self._place_cross(cross, row, col)
+        self._draw_clues()
+        self._draw_notice(left, top, clue_width - CLUE_GAP, clue_height - CLUE_GAP)
+
+    def _clue_extent(self):
+        # Widest row clue, tallest column clue, tallest row clue and widest
+        # column clue of the current rendering
+        row_textures = self._clue_textures[:self.grid_height]
+        column_textures = self._clue_textures[self.grid_height:]
+        return (max(texture.width for texture in row_textures), max(texture.height for texture in column_textures),
+                max(texture.height for texture in row_textures), max(texture.width for texture in column_textures))
+
+    def _resize_pool(self, pool, group, count, factory):
+        # Grow or shrink a pool of instructions in `group` to exactly `count`
+        while len(pool) < count:
+            instruction = factory()
+            pool.append(instruction)
+            group.add(instruction)
+        while len(pool) > count:
+            group.remove(pool.pop())
+        return pool
+
+    def _new_cross(self):
+        group = InstructionGroup()
+        group.add(Color(0, 0, 0, 1))
+        first = Line(width=2)
+        second = Line(width=2)
+        group.add(first)
+        group.add(second)
+        return group, first, second
+
+    def _place_cross(self, cross, row, col):
+        size = self.cell_size
+        x = self.grid_x + col * size
+        top = self.grid_top - row * size
+        cross[1].points = [x, top - size, x + size, top]
+        cross[2].points = [x, top, x + size, top - size]
+
+    def _render_clues(self, font_size):
+        if font_size == self._clue_font_size:
+            # Text only has to be rendered again when the scale changes
+            return
+        self._clue_font_size = font_size
+        self._clue_textures = []
+        for clue in self.row_clues:
+            self._clue_textures.append(self._render(" ".join(map(str, clue)), font_size, "right"))
+        for clue in self.column_clues:
+            self._clue_textures.append(self._render("\n".join(map(str, clue)), font_size, "center"))
+
+    def _draw_clues(self):
+        size = self.cell_size
+        scale = self.clue_scale
+        rects = self._resize_pool(self._clue_pool, self._clues, self.grid_height + self.grid_width, Rectangle)
+        for row in range(self.grid_height):
+            texture = self._clue_textures[row]
+            width, height = texture.width * scale, texture.height * scale
+            rect = rects[row]
+            rect.texture = texture
+            rect.size = (width, height)
+            rect.pos = (self.grid_x - width - CLUE_GAP, self.grid_top - (row + 1) * size + (size - height) / 2)
+        for col in range(self.grid_width):
+            texture = self._clue_textures[self.grid_height + col]
+            width, height = texture.width * scale, texture.height * scale
+            rect = rects[self.grid_height + col]
+            rect.texture = texture
+            rect.size = (width, height)
+            rect.pos = (self.grid_x + col * size + (size - width) / 2, self.grid_top + CLUE_GAP)
+
+    def _draw_notice(self, left, top, width, height):
+        # Tell the player the clues are scaled down, in the empty corner
+        # above the row clues and left of the column clues
+        if self.clue_scale >= 1:
+            self._notice.size = (0, 0)
+            return
+        texture = self._render(f"Clues shown at {self.clue_scale:.0%}.\nEnlarge the window\nto read them.",
+                               NOTICE_FONT_SIZE, "left")
+        fit = min(1, width / texture.width, height / texture.height)
+        self._notice.texture = texture
+        self._notice.size = (texture.width * fit, texture.height * fit)
+        self._notice.pos = (left, top - texture.height * fit)
+
+    def _render(self, text, font_size, halign):
+        key = (text, font_size, halign)
+        texture = self._rendered.get(key)
+        if texture is None:
+            if len(self._rendered) >= 4096:
+                self._rendered.clear()
+            label = CoreLabel(text=text, font_size=font_size, halign=halign)
+            label.refresh()
+            texture = label.texture
+            self._rendered[key] = texture
+        return texture
@@ -0,0 +1,174 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+
+from nonogram import format_nonogram
+
+# Printable puzzle books from the JSON lines written by `python -m nonogram
+# generate`. Books are written one page at a time, so a 10k-puzzle book needs
+# no more memory than a single page.
+
+# A4 portrait in millimetres
+PAGE_WIDTH = 210
+PAGE_HEIGHT = 297
+MARGIN = 12
+
+
+def read_puzzles(lines):
+    """Yield (number, grid, row_clues, column_clues) for each puzzle in JSON lines.
+
+    Records that carry an "error" instead of a puzzle are skipped; puzzles are
+    numbered from their "index" so numbers match the generate run.
+    """
+    for position, line in enumerate(lines):
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if "error" in record:
+            continue
+        yield record.get("index", position) + 1, record["grid"], record["row_clues"], record["column_clues"]
+
+
+def _pages(puzzles, per_page):
+    puzzles = iter(puzzles)
+    while True:
+        page = list(itertools.islice(puzzles, per_page))
+        if not page:
+            return
+        yield page
+
+
+def write_text_book(puzzles, out, solutions=None, per_page=2):
+    """Write puzzles as plain text, `per_page` to a page with form feeds between pages.
+
+    Blank puzzles go to `out`; if `solutions` is given the solved versions go
+    there with the same page layout.
+    """
+    for page_number, page in enumerate(_pages(puzzles, per_page)):
+        for stream, empty in ((out, True), (solutions, False)):
+            if stream is None:
+                continue
+            parts = ["\f" if page_number else ""]
+            for number, grid, row_clues, column_clues in page:
+                parts.append(f"Puzzle {number} ({len(grid)}x{len(grid[0])})\n\n")
+                parts.append(format_nonogram(grid, row_clues, column_clues, empty))
+                parts.append("\n")
+            stream.write("".join(parts))
+
+
+def _svg_puzzle(parts, number, grid, row_clues, column_clues, solved, x, y, width, height):
+    # Draw one puzzle (title, clues and grid) into the box at (x, y)
+    rows, cols = len(grid), len(grid[0])
+    row_clue_len = max(len(clue) for clue in row_clues)
+    col_clue_len = max(len(clue) for clue in column_clues)
+    title_height = 6
+    cell = min(width / (cols + row_clue_len * 0.8), (height - title_height) / (rows + col_clue_len * 0.8))
+    font = cell * 0.6
+    left = x + row_clue_len * cell * 0.8
+    top = y + title_height + col_clue_len * cell * 0.8
+    parts.append(f'<text x="{x:.2f}" y="{y + 4:.2f}" font-size="4">Puzzle {number} ({rows}x{cols})</text>\n')
+
+    for c, clue in enumerate(column_clues):
+        cx = left + (c + 0.5) * cell
+        for k, num in enumerate(clue):
+            cy = top - (len(clue) - k - 0.25) * cell * 0.8
+            parts.append(f'<text x="{cx:.2f}" y="{cy:.2f}" font-size="{font:.2f}" text-anchor="middle">{num}</text>\n')
+    for r, clue in enumerate(row_clues):
+        cy = top + (r + 0.7) * cell
+        text = " ".join(map(str, clue))
+        parts.append(f'<text x="{left - cell * 0.2:.2f}" y="{cy:.2f}" font-size="{font:.2f}" '
+                     f'text-anchor="end">{text}</text>\n')
+
+    if solved:
+        parts.append('<g fill="black">\n')
+        for r, line in enumerate(grid):
+            for c, value in enumerate(line):
+                if value:
+                    parts.append(f'<rect x="{left + c * cell:.2f}" y="{top + r * cell:.2f}" '
+                                 f'width="{cell:.2f}" height="{cell:.2f}"/>\n')
+        parts.append('</g>\n')
+
+    # Grid lines, with every fifth line heavier to help counting
+    right = left + cols * cell
+    bottom = top + rows * cell
+    parts.append('<g stroke="black" fill="none">\n')
+    for r in range(rows + 1):
+        weight = 0.5 if r % 5 == 0 or r == rows else 0.15
+        parts.append(f'<line x1="{left:.2f}" y1="{top + r * cell:.2f}" x2="{right:.2f}" y2="{top + r * cell:.2f}" '
+                     f'stroke-width="{weight}"/>\n')
+    for c in range(cols + 1):
+        weight = 0.5 if c % 5 == 0 or c == cols else 0.15
+        parts.append(f'<line x1="{left + c * cell:.2f}" y1="{top:.2f}" x2="{left + c * cell:.2f}" y2="{bottom:.2f}" '
+                     f'stroke-width="{weight}"/>\n')
+    parts.append('</g>\n')
+
+
+def svg_page(page, solved=False, columns=2):
+    """Render one page of (number, grid, row_clues, column_clues) puzzles as an SVG document."""
+    rows = -(-len(page) // columns)
+    slot_width = (PAGE_WIDTH - 2 * MARGIN) / columns
+    slot_height = (PAGE_HEIGHT - 2 * MARGIN) / max(rows, 1)
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{PAGE_WIDTH}mm" height="{PAGE_HEIGHT}mm" '
+             f'viewBox="0 0 {PAGE_WIDTH} {PAGE_HEIGHT}" font-family="sans-serif">\n',
+             f'<rect width="{PAGE_WIDTH}" height="{PAGE_HEIGHT}" fill="white"/>\n']
+    for position, (number, grid, row_clues, column_clues) in enumerate(page):
+        row, col = divmod(position, columns)
+        x = MARGIN + col * slot_width
+        y = MARGIN + row * slot_height
+        # Leave a gap between neighbouring puzzles
+        _svg_puzzle(parts, number, grid, row_clues, column_clues, solved,
+                    x, y, slot_width - 6, slot_height - 6)
+    parts.append("</svg>\n")
+    return "".join(parts)
+
+
+def write_svg_book(puzzles, directory, solutions=None, per_page=4, columns=2):
+    """Write puzzles as one SVG file per page (page-0001.svg, ...) into `directory`.
+
+    If `solutions` is given, the solved pages go into that directory under
+    the same names. Returns the number of pages written.
+    """
+    pages = 0
+    for pages, page in enumerate(_pages(puzzles, per_page), 1):
+        for target, solved in ((directory, False), (solutions, True)):
+            if target is None:
+                continue
+            os.makedirs(target, exist_ok=True)
+            with open(os.path.join(target, f"page-{pages:04d}.svg"), "w", encoding="utf-8") as f:
+                f.write(svg_page(page, solved, columns))
+    return pages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="nonogram_book", description="Turn generated puzzles into a printable book.")
+    parser.add_argument("input", help="JSON lines from 'python -m nonogram generate', or - for stdin")
+    parser.add_argument("--format", choices=("text", "svg"), default="text", help="book format (default text)")
+    parser.add_argument("--output", help="text: output file (default stdout); svg: output directory (default 'book')")
+    parser.add_argument("--solutions", help="also write the solved puzzles to this file or directory")
+    parser.add_argument("--per-page", type=int, help="puzzles per page (default 2 for text, 4 for svg)")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    try:
+        puzzles = read_puzzles(source)
+        if args.format == "svg":
+            write_svg_book(puzzles, args.output or "book", args.solutions, args.per_page or 4)
+        else:
+            out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+            solutions = open(args.solutions, "w", encoding="utf-8") if args.solutions else None
+            try:
+                write_text_book(puzzles, out, solutions, args.per_page or 2)
+            finally:
+                if out is not sys.stdout:
+                    out.close()
+                if solutions:
+                    solutions.close()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+
+if __name__ == "__main__":
+    main()
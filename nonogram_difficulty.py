@@ -0,0 +1,106 @@
+import random
+from collections import namedtuple
+
+import instrumentation
+import nonogram_solver
+from nonogram import calculate_clues, generate_nonogram
+from nonogram_solver import Board, apply_overlaps, count_solutions, probe, propagate
+from puzzle_grading import LEVELS, PROBE_WEIGHT, distance, probe_level
+
+# Difficulty levels (see puzzle_grading for hard and expert):
+#   easy    line logic alone, in few propagation rounds
+#   medium  line logic alone, but deductions chain over many rounds
+
+# techniques is a tuple of the deductions used: "overlap", "line", "probe", "guess"
+Grade = namedtuple("Grade", "level score rounds line_solves probes techniques")
+
+
+def _easy_rounds(height, width):
+    # Rounds of line logic a puzzle may take and still count as easy
+    return max(height, width) // 2 + 2
+
+
+@instrumentation.timed("grade_nonogram")
+def grade_nonogram(row_clues, column_clues, line_solver=None):
+    """Grade a puzzle by replaying how a logic solver gets through it.
+
+    The solver applies the overlap rule, sweeps the board with line logic in
+    rounds and, when that gets stuck, probes cells (nonogram_solver.probe)
+    until one is decided and sweeps again. Returns a Grade recording the level, a score (rounds plus
+    PROBE_WEIGHT per probe), the number of rounds and line solves, the
+    probes and the techniques used, or None if the clues have no solution.
+    Unless "guess" is among the techniques, the puzzle is proven to have a
+    single solution.
+    """
+    if line_solver is None:
+        line_solver = nonogram_solver.line_cache
+    board = Board(row_clues, column_clues)
+    dirty = apply_overlaps(board)
+    if dirty is None:
+        return None
+    stats = {"rounds": 0, "line_solves": 0, "deductions": 0}
+    if not propagate(board, dirty, line_solver, stats=stats):
+        return None
+    # One probe at a time, each followed by the line logic it sets off
+    guessed = False
+    while not board.is_solved():
+        deductions = stats["deductions"]
+        if not probe(board, line_solver, stats=stats, max_deductions=1):
+            return None
+        if stats["deductions"] == deductions:
+            guessed = True
+            break
+
+    rounds, solves, probes = stats["rounds"], stats["line_solves"], stats["deductions"]
+    techniques = ["overlap"]
+    if rounds:
+        techniques.append("line")
+    if probes:
+        techniques.append("probe")
+    if guessed:
+        techniques.append("guess")
+    score = rounds + PROBE_WEIGHT * probes
+    level = probe_level(probes, guessed)
+    if level is None:
+        level = "easy" if rounds <= _easy_rounds(board.height, board.width) else "medium"
+    return Grade(level, score, rounds, solves, probes, tuple(techniques))
+
+
+@instrumentation.timed("generate_graded_nonogram")
+def generate_graded_nonogram(height, width, level, density=0.5, max_steps=300, max_branches=200,
+                             rng=random, line_solver=None):
+    """Generate a puzzle with a single solution at the requested difficulty level.
+
+    Starts from a unique random puzzle and walks towards `level` by flipping
+    one cell at a time. Only the clues of the flipped cell's row and column
+    change, so re-grading mostly hits lines the shared line cache has already
+    solved. A flip is kept if the puzzle stays unique and does not move away
+    from the target. Returns (grid, row_clues, column_clues, grade).
+    """
+    target = LEVELS.index(level)
+    grid, row_clues, column_clues = generate_nonogram(height, width, density, unique=True, rng=rng)
+    grade = grade_nonogram(row_clues, column_clues, line_solver)
+    for _ in range(max_steps):
+        if grade.level == level:
+            return grid, row_clues, column_clues, grade
+        r, c = rng.randrange(height), rng.randrange(width)
+        old_row, old_column = row_clues[r], column_clues[c]
+        grid[r][c] = 1 - grid[r][c]
+        row_clues[r] = calculate_clues(grid[r])
+        column_clues[c] = calculate_clues([grid[i][c] for i in range(height)])
+        new_grade = grade_nonogram(row_clues, column_clues, line_solver)
+        if new_grade is not None and "guess" in new_grade.techniques:
+            # Logic alone no longer proves the puzzle unique
+            if count_solutions(row_clues, column_clues, limit=2, max_branches=max_branches,
+                               line_solver=line_solver)[0] != 1:
+                new_grade = None
+        if new_grade is not None and distance(new_grade, target) <= distance(grade, target):
+            grade = new_grade
+            continue
+        grid[r][c] = 1 - grid[r][c]
+        row_clues[r], column_clues[c] = old_row, old_column
+        if instrumentation.enabled:
+            instrumentation.count("rejected_flips")
+    if grade.level == level:
+        return grid, row_clues, column_clues, grade
+    raise RuntimeError(f"Could not reach {level} difficulty for a {height}x{width} nonogram in {max_steps} steps")
@@ -0,0 +1,128 @@
+import time
+from collections import namedtuple
+
+import instrumentation
+import nonogram_solver
+from nonogram_solver import COLUMN, EMPTY, FILLED, ROW, Board, propagate
+
+# Player cell states, as used by NonogramBoard
+UNSHADED = 0
+SHADED = 1
+CROSSED = 2
+
+# action is "shade", "cross" or "mistake"; row and col are None for a mistake
+Hint = namedtuple("Hint", "row col action reason")
+
+
+def _line_name(axis, index, clue):
+    kind = "Row" if axis == ROW else "Column"
+    return f"{kind} {index + 1} (clue {' '.join(map(str, clue)) or '0'})"
+
+
+def player_board(row_clues, column_clues, states):
+    """Solver Board holding what the player has marked: shaded cells are filled, X cells empty."""
+    board = Board(row_clues, column_clues)
+    for row, line in enumerate(states):
+        for col, state in enumerate(line):
+            if state == SHADED:
+                board.set_cell(row, col, FILLED)
+            elif state == CROSSED:
+                board.set_cell(row, col, EMPTY)
+    return board
+
+
+def _lines_by_cost(board):
+    # Lines with the least room to move come first: their deductions are the
+    # easiest for a player to see and the most likely to force something.
+    # Finished lines are kept so wrong marks in them are still caught.
+    lines = []
+    for axis, clues, length, filled, empty in (
+            (ROW, board.row_clues, board.width, board.row_filled, board.row_empty),
+            (COLUMN, board.column_clues, board.height, board.col_filled, board.col_empty)):
+        for index, clue in enumerate(clues):
+            unknown = length - bin(filled[index] | empty[index]).count("1")
+            slack = length - sum(clue) - max(0, len(clue) - 1)
+            lines.append((slack, unknown, axis, index))
+    lines.sort()
+    return lines
+
+
+def _line(board, axis, index):
+    if axis == ROW:
+        return board.row_clues[index], board.width, board.row_filled[index], board.row_empty[index]
+    return board.column_clues[index], board.height, board.col_filled[index], board.col_empty[index]
+
+
+@instrumentation.timed("find_hint")
+def find_hint(row_clues, column_clues, states, time_budget=0.05, line_solver=None):
+    """Find the cheapest move that follows logically from the player's marks.
+
+    First looks for a cell forced by a single row or column on its own, trying
+    the most constrained lines first. If no line forces anything, probes
+    undecided cells: a cell whose shading (or crossing out) leaves some line
+    with no valid placement must take the other value. A line that can no
+    longer match its clue is reported as a "mistake" hint.
+
+    Gives up and returns None once `time_budget` seconds have passed, or if
+    nothing can be proven; callers fall back to a cheaper heuristic then.
+    """
+    deadline = time.perf_counter() + time_budget
+    if line_solver is None:
+        line_solver = nonogram_solver.line_cache
+    board = player_board(row_clues, column_clues, states)
+    lines = _lines_by_cost(board)
+
+    for _, _, axis, index in lines:
+        if time.perf_counter() > deadline:
+            if instrumentation.enabled:
+                instrumentation.count("hint_timeouts")
+            return None
+        clue, length, filled, empty = _line(board, axis, index)
+        result = line_solver(clue, length, filled, empty)
+        if result is None:
+            return Hint(None, None, "mistake",
+                        f"{_line_name(axis, index, clue)} can't be completed with the current marks")
+        new_filled, new_empty = result
+        forced = (new_filled & ~filled) | (new_empty & ~empty)
+        if forced:
+            low = forced & -forced
+            pos = low.bit_length() - 1
+            row, col = (index, pos) if axis == ROW else (pos, index)
+            action = "shade" if new_filled & low else "cross"
+            return Hint(row, col, action, f"{_line_name(axis, index, clue)} forces it")
+
+    # Line logic is stuck on the player's marks; try each value of each cell
+    for _, _, axis, index in lines:
+        clue, length, filled, empty = _line(board, axis, index)
+        unknown = ((1 << length) - 1) & ~(filled | empty)
+        while unknown:
+            low = unknown & -unknown
+            unknown ^= low
+            pos = low.bit_length() - 1
+            row, col = (index, pos) if axis == ROW else (pos, index)
+            for value in (FILLED, EMPTY):
+                trial = board.copy()
+                trial.set_cell(row, col, value)
+                try:
+                    consistent = propagate(trial, [(ROW, row), (COLUMN, col)], line_solver, deadline)
+                except TimeoutError:
+                    if instrumentation.enabled:
+                        instrumentation.count("hint_timeouts")
+                    return None
+                if not consistent:
+                    conflict_axis, conflict_index = trial.conflict
+                    conflict_clue = (trial.row_clues if conflict_axis == ROW else trial.column_clues)[conflict_index]
+                    action = "cross" if value == FILLED else "shade"
+                    tried = "shading" if value == FILLED else "crossing out"
+                    return Hint(row, col, action,
+                                f"{tried} it leaves {_line_name(conflict_axis, conflict_index, conflict_clue)} "
+                                f"with no valid arrangement")
+    return None
+
+
+def describe_hint(hint):
+    """Status line text for a hint from find_hint."""
+    if hint.action == "mistake":
+        return f"Check your marks: {hint.reason}"
+    verb = "Shade" if hint.action == "shade" else "Mark X on"
+    return f"Suggested move: {verb} cell in row {hint.row + 1}, column {hint.col + 1} - {hint.reason}"
@@ -0,0 +1,295 @@
+import argparse
+import json
+import os
+import random
+import sys
+
+import numpy as np
+
+from nonogram import calculate_clues, make_unique, parse_size, validate_nonogram
+
+# Nonograms from pictures. An image is read as an "ink" array (floats from
+# 0 for white to 1 for black), shrunk to the puzzle size by averaging the
+# pixels that fall in each cell, then thresholded into a grid of 0 and 1.
+# Clues come from calculate_clues, and make_unique can flip the few cells the
+# solutions disagree on until the puzzle has a single solution. Needs NumPy.
+#
+#   python nonogram_image.py pictures/ --size 25x25 --unique --output puzzles.jsonl
+#
+# writes one JSON line per image in the format of `python -m nonogram
+# generate`, so the output can go straight to nonogram_book.py.
+
+# File types convert_folder picks up: Netpbm images and NumPy arrays
+IMAGE_SUFFIXES = (".pbm", ".pgm", ".ppm", ".pnm", ".npy")
+
+# Search budget for make_unique. A picture can't be redrawn like a random
+# grid when the search gives up, so it gets more branches than
+# generate_nonogram's default
+UNIQUE_BRANCHES = 1000
+
+
+def _header(data, fields):
+    # The magic number and `fields` numbers of a Netpbm header, plus the
+    # offset of the raster that follows the single whitespace after them
+    values = []
+    position = 2
+    while len(values) < fields:
+        while position < len(data) and (data[position:position + 1].isspace() or data[position] == ord("#")):
+            if data[position] == ord("#"):
+                position = data.find(b"\n", position)
+                if position < 0:
+                    raise ValueError("truncated Netpbm header")
+            position += 1
+        start = position
+        while position < len(data) and data[position:position + 1].isdigit():
+            position += 1
+        if start == position:
+            raise ValueError("truncated Netpbm header")
+        values.append(int(data[start:position]))
+    return values, position + 1
+
+
+def _strip_comments(text):
+    return b"\n".join(line.partition(b"#")[0] for line in text.split(b"\n"))
+
+
+def parse_netpbm(data):
+    """Return the ink array of a PBM, PGM or PPM image given as bytes.
+
+    Plain (P1-P3) and raw (P4-P6) formats are read. Colour images are
+    averaged to grey.
+    """
+    magic = data[:2]
+    if magic not in (b"P1", b"P2", b"P3", b"P4", b"P5", b"P6"):
+        raise ValueError(f"not a Netpbm image (magic number {magic!r})")
+    bitmap = magic in (b"P1", b"P4")
+    channels = 3 if magic in (b"P3", b"P6") else 1
+    (width, height, *rest), offset = _header(data, 2 if bitmap else 3)
+    maxval = 1 if bitmap else rest[0]
+    if not width or not height:
+        raise ValueError(f"Netpbm image has no pixels ({width}x{height})")
+    if not 0 < maxval < 65536:
+        raise ValueError(f"Netpbm maximum grey value must be from 1 to 65535, got {maxval}")
+    size = width * height * channels
+
+    if magic == b"P4":
+        # Every row is padded to a whole byte; a set bit is black
+        row_bytes = (width + 7) // 8
+        if len(data) - offset < height * row_bytes:
+            raise ValueError("truncated Netpbm image")
+        raster = np.frombuffer(data, dtype=np.uint8, count=height * row_bytes, offset=offset)
+        pixels = np.unpackbits(raster.reshape(height, row_bytes), axis=1)[:, :width]
+        return pixels.astype(np.float32)
+    if magic == b"P1":
+        # Plain bitmaps need no whitespace between digits
+        text = _strip_comments(data[offset:])
+        digits = np.frombuffer(text, dtype=np.uint8)
+        digits = digits[(digits == ord("0")) | (digits == ord("1"))][:size]
+        if len(digits) < size:
+            raise ValueError("truncated Netpbm image")
+        return (digits - ord("0")).reshape(height, width).astype(np.float32)
+    if magic in (b"P2", b"P3"):
+        pixels = np.array(_strip_comments(data[offset:]).split()[:size], dtype=np.float32)
+    else:
+        dtype = np.dtype(np.uint8 if maxval < 256 else ">u2")
+        if len(data) - offset < size * dtype.itemsize:
+            raise ValueError("truncated Netpbm image")
+        pixels = np.frombuffer(data, dtype=dtype, count=size, offset=offset).astype(np.float32)
+    if len(pixels) < size:
+        raise ValueError("truncated Netpbm image")
+    pixels = pixels.reshape(height, width, channels).mean(axis=2)
+    # Grey levels run from 0 for black to maxval for white
+    return 1 - pixels / maxval
+
+
+def ink_from_pixels(pixels, maxval=255):
+    """Turn a greyscale (height, width) or colour (height, width, channels) pixel array into ink.
+
+    Pixels run from 0 for black to `maxval` for white; colour channels are
+    averaged and a fourth (alpha) channel is ignored.
+    """
+    pixels = np.asarray(pixels, dtype=np.float32)
+    if pixels.ndim not in (2, 3):
+        raise ValueError(f"expected a 2D or 3D pixel array, got shape {pixels.shape}")
+    if not pixels.size:
+        raise ValueError(f"pixel array has no pixels (shape {pixels.shape})")
+    if pixels.ndim == 3:
+        pixels = pixels[:, :, :3].mean(axis=2)
+    if maxval <= 0:
+        raise ValueError(f"maxval must be positive, got {maxval}")
+    return 1 - pixels / maxval
+
+
+def read_image(path):
+    """Read a Netpbm image or a .npy pixel array (0-255, 0 is black) as ink."""
+    if path.lower().endswith(".npy"):
+        pixels = np.load(path)
+        maxval = 1 if pixels.dtype == bool else 255
+        return ink_from_pixels(pixels, maxval)
+    with open(path, "rb") as f:
+        return parse_netpbm(f.read())
+
+
+def _resample(ink, axis, size):
+    # Shrink one axis to `size` cells by averaging the pixels that fall in
+    # each cell, or stretch it by repeating the nearest pixel
+    length = ink.shape[axis]
+    if size > length:
+        return np.take(ink, np.arange(size) * length // size, axis=axis)
+    edges = np.arange(size + 1) * length // size
+    sums = np.add.reduceat(ink, edges[:-1], axis=axis)
+    shape = [1, 1]
+    shape[axis] = size
+    return sums / np.diff(edges).reshape(shape)
+
+
+def otsu_threshold(values, bins=256):
+    """The threshold between 0 and 1 that best splits `values` into two classes (Otsu's method)."""
+    counts, edges = np.histogram(values, bins=bins, range=(0, 1))
+    centres = (edges[:-1] + edges[1:]) / 2
+    below = np.cumsum(counts)[:-1]
+    above = len(np.ravel(values)) - below
+    below_sum = np.cumsum(counts * centres)[:-1]
+    total = below_sum[-1] + counts[-1] * centres[-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        spread = below * above * (below_sum / below - (total - below_sum) / above) ** 2
+    spread = np.nan_to_num(spread)
+    if not spread.any():
+        # A flat image has nothing to split
+        return 0.5
+    # Every threshold between two well separated groups of values splits
+    # them equally well; take the middle of those
+    best = np.flatnonzero(spread == spread.max())
+    return float(edges[1:-1][(best[0] + best[-1]) // 2])
+
+
+def fit_size(image_height, image_width, height, width):
+    """The largest size within height x width that keeps the image's aspect ratio."""
+    scale = min(height / image_height, width / image_width)
+    return max(1, round(image_height * scale)), max(1, round(image_width * scale))
+
+
+def image_grid(ink, height, width, threshold=None):
+    """Shrink an ink array to height x width cells and threshold it into a grid of 0 and 1.
+
+    A cell is filled when its average ink is above `threshold`; by default
+    the threshold is picked per image with otsu_threshold.
+    """
+    ink = np.asarray(ink, dtype=np.float32)
+    if ink.ndim != 2 or not ink.size:
+        raise ValueError(f"expected a non-empty 2D ink array, got shape {ink.shape}")
+    cells = _resample(_resample(ink, 0, height), 1, width)
+    if threshold is None:
+        threshold = otsu_threshold(cells)
+    return (cells > threshold).astype(int).tolist()
+
+
+def image_nonogram(ink, height, width, threshold=None, unique=False, rng=random):
+    """Turn an ink array into (grid, row_clues, column_clues), like generate_nonogram.
+
+    With `unique`, make_unique flips cells where two solutions of the clues
+    disagree until only one solution is left. The grid keeps its fill and
+    usually changes in a handful of cells. A picture that still isn't unique
+    after that is reported with RuntimeError rather than changed further.
+    """
+    grid = image_grid(ink, height, width, threshold)
+    if unique:
+        clues = make_unique(grid, max_branches=UNIQUE_BRANCHES, minimal=True, rng=rng)
+        if clues is None:
+            raise RuntimeError(f"The {height}x{width} picture is not uniquely solvable in a few cell changes")
+        return grid, clues[0], clues[1]
+    row_clues = [calculate_clues(row) for row in grid]
+    column_clues = [calculate_clues([grid[r][c] for r in range(height)]) for c in range(width)]
+    return grid, row_clues, column_clues
+
+
+def _convert_item(task):
+    # Process pool worker for convert_folder; the record matches the ones
+    # `nonogram generate` writes, with the image path as "source"
+    index, path, height, width, keep_aspect, threshold, unique, seed = task
+    record = {"index": index, "source": path}
+    try:
+        ink = read_image(path)
+        if keep_aspect:
+            height, width = fit_size(ink.shape[0], ink.shape[1], height, width)
+        record["height"], record["width"] = height, width
+        grid, row_clues, column_clues = image_nonogram(ink, height, width, threshold, unique,
+                                                       random.Random(f"{seed}:{path}"))
+    except Exception as exc:
+        # One bad file must not stop a whole folder: unreadable files, a
+        # broken .npy (EOFError, pickle errors) or a picture that can't be
+        # made unique all end up in the record
+        record["error"] = str(exc) or type(exc).__name__
+        return record
+    record["grid"] = grid
+    record["row_clues"] = row_clues
+    record["column_clues"] = column_clues
+    record["valid"] = validate_nonogram(grid, row_clues, column_clues)
+    return record
+
+
+def find_images(directory):
+    """Paths of the convertible files under `directory`, recursively and in sorted order."""
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        paths.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith(IMAGE_SUFFIXES))
+    return paths
+
+
+def convert_folder(paths, height, width, keep_aspect=False, threshold=None, unique=False, seed="0",
+                   workers=None, chunksize=8):
+    """Yield a puzzle record for every image in `paths`, in order, converted by `workers` processes.
+
+    Images that cannot be read or made unique give a record with an "error"
+    instead of a puzzle. Cells flipped by make_unique depend only on `seed`
+    and the image path, so a run can be repeated exactly.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    tasks = ((index, path, height, width, keep_aspect, threshold, unique, seed) for index, path in enumerate(paths))
+    if workers <= 1:
+        yield from map(_convert_item, tasks)
+        return
+    # Imported here so that importing this module for its image functions stays fast
+    import multiprocessing
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap(_convert_item, tasks, chunksize)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="nonogram_image", description="Turn pictures into nonogram puzzles.")
+    parser.add_argument("input", nargs="+", help="image files or folders of images (PBM, PGM, PPM or .npy)")
+    parser.add_argument("--size", type=parse_size, default=(20, 20), help="puzzle size as HxW (default 20x20)")
+    parser.add_argument("--keep-aspect", action="store_true",
+                        help="treat --size as a bound and keep each image's aspect ratio")
+    parser.add_argument("--threshold", type=float,
+                        help="ink level (0-1) above which a cell is filled (default: chosen per image)")
+    parser.add_argument("--unique", action="store_true",
+                        help="flip the cells that make a puzzle ambiguous, or report the image as an error")
+    parser.add_argument("--seed", default="0", help="seed for the cells --unique changes")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--chunksize", type=int, default=8, help="images handed to a worker at a time")
+    parser.add_argument("--output", help="write to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    paths = []
+    for name in args.input:
+        paths.extend(find_images(name) if os.path.isdir(name) else [name])
+    height, width = args.size
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    failed = 0
+    try:
+        for record in convert_folder(paths, height, width, args.keep_aspect, args.threshold, args.unique,
+                                     args.seed, args.workers, max(1, args.chunksize)):
+            failed += "error" in record
+            out.write(json.dumps(record, separators=(",", ":")) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if failed:
+        print(f"{failed} of {len(paths)} images could not be converted", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
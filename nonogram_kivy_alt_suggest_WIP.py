@@ -1,42 +1,18 @@
 from kivy.app import App
-from kivy.uix.gridlayout import GridLayout
 from kivy.uix.label import Label
 from kivy.uix.button import Button
 from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.widget import Widget
-from kivy.graphics import Color, Rectangle, Line
-from kivy.uix.behaviors import ButtonBehavior
-from kivy.properties import NumericProperty
-from kivy.core.window import Window
-import random
-
-# Core Nonogram logic
-def generate_structured_grid(height, width, density=0.5):
-    grid = [[0 for _ in range(width)] for _ in range(height)]
-    for i in range(height):
-        for j in range(width):
-            grid[i][j] = 1 if random.random() < density else 0
-    return grid
-
-def calculate_clues(line):
-    clues = []
-    count = 0
-    for cell in line:
-        if cell == 1:
-            count += 1
-        else:
-            if count > 0:
-                clues.append(count)
-                count = 0
-    if count > 0:
-        clues.append(count)
-    return clues or [0]
-
-def generate_nonogram(height, width, density=0.5):
-    grid = generate_structured_grid(height, width, density)
-    row_clues = [calculate_clues(row) for row in grid]
-    column_clues = [calculate_clues([grid[r][c] for r in range(height)]) for c in range(width)]
-    return grid, row_clues, column_clues
+from kivy.clock import Clock
+
+from nonogram import ProgressTracker, generate_nonogram
+from nonogram_board import NonogramBoard
+from nonogram_hints import describe_hint, find_hint
+from puzzle_prefetch import PuzzlePrefetcher
+
+# Seconds the hint engine may spend on one suggestion
+HINT_TIME_BUDGET = 0.05
+# Puzzles kept generated ahead of the "Generate New Nonogram" button
+PREFETCH_DEPTH = 3
 
 def calculate_adjacent_shaded(solved_grid):
     rows, cols = len(solved_grid), len(solved_grid[0])
@@ -53,54 +29,29 @@ def calculate_adjacent_shaded(solved_grid):
 
     return adjacent_counts
 
-# Custom widget for interactive Nonogram cell
-class NonogramCell(ButtonBehavior, Widget):
-    cell_state = NumericProperty(0)  # 0: unshaded, 1: shaded, 2: X
-
-    def __init__(self, quadrant_color, **kwargs):
-        super(NonogramCell, self).__init__(**kwargs)
-        self.quadrant_color = quadrant_color
-        self.darker_shade = [c * 0.6 for c in quadrant_color]  # Darker shade of the vibrant quadrant color
-        self.bind(pos=self.update_rect, size=self.update_rect, cell_state=self.update_rect)
-        with self.canvas:
-            self.rect = Rectangle(pos=self.pos, size=self.size)
-        self.update_rect()
-
-    def on_press(self):
-        self.cell_state = (self.cell_state + 1) % 3
-        self.update_rect()
-
-    def update_rect(self, *args):
-        self.canvas.clear()
-        with self.canvas:
-            if self.cell_state == 0:  # Unshaded
-                Color(*self.quadrant_color)
-            elif self.cell_state == 1:  # Shaded
-                Color(*self.darker_shade)
-            else:  # Marked with an 'X'
-                Color(*self.quadrant_color)
-                self.rect = Rectangle(pos=self.pos, size=self.size)
-                Color(0, 0, 0, 1)
-                Line(points=[self.x, self.y, self.right, self.top], width=2)
-                Line(points=[self.x, self.top, self.right, self.y], width=2)
-                return
-            self.rect = Rectangle(pos=self.pos, size=self.size)
-
 class NonogramApp(App):
+    # Define vibrant quadrant colors
+    quadrant_colors = [
+        (0.4, 0.7, 1, 1),  # Vibrant blue
+        (0.4, 1, 0.4, 1),  # Vibrant green
+        (1, 0.4, 0.4, 1),  # Vibrant red
+        (1, 1, 0.4, 1)     # Vibrant yellow
+    ]
+
     def build(self):
+        # Imported here because importing kivy.core.window opens the window
+        from kivy.core.window import Window
+
         self.grid_height = 10
         self.grid_width = 10
         
-        # Get screen size at runtime
-        self.screen_width = Window.width
-        self.screen_height = Window.height
-        
         # Main layout with vertical orientation
         main_layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
         
-        # Grid layout for the Nonogram
-        self.grid_layout = GridLayout(cols=self.grid_width + 1, padding=5, spacing=1, size_hint=(None, None))
-        main_layout.add_widget(self.grid_layout)
+        # Board widget drawing the clues and cells of the Nonogram
+        self.board = NonogramBoard(cell_color=self.cell_color, size_hint=(1, 1))
+        self.board.bind(on_cell_state=self.on_cell_state)
+        main_layout.add_widget(self.board)
         
         # Persistent result label (directly below the grid)
         self.result_label = Label(
@@ -131,104 +82,79 @@ class NonogramApp(App):
         suggest_button.bind(on_press=self.suggest_move)
         main_layout.add_widget(suggest_button)
 
-        # Generate the initial Nonogram
-        self.generate_nonogram()
+        # Show the first Nonogram straight away and keep the next few ready in the background
+        self.show_puzzle(self.make_puzzle())
+        self.prefetcher = PuzzlePrefetcher(self.make_puzzle, PREFETCH_DEPTH, deliver=self.deliver_puzzle)
 
         return main_layout
 
+    def on_stop(self):
+        self.prefetcher.stop()
+
+    def make_puzzle(self):
+        # Runs on the prefetch thread, so it must not touch any widgets
+        return generate_nonogram(self.grid_height, self.grid_width, density=0.5)
+
+    def deliver_puzzle(self, callback, puzzle):
+        # Hand a puzzle made on the prefetch thread back to the UI thread
+        Clock.schedule_once(lambda dt: callback(puzzle))
+
     def generate_nonogram(self, *args):
-        # Clear grid before generating a new one
-        self.grid_layout.clear_widgets()
+        # Take a ready puzzle; if none is ready yet, the next one is shown as soon as it is made
+        self.prefetcher.get(self.show_puzzle, self.show_generation_error)
+
+    def show_generation_error(self, error):
+        # The prefetcher gave up after several failed attempts
+        self.result_label.text = f"Could not generate a puzzle: {error}"
 
-        # Generate the grid and clues
-        grid, row_clues, column_clues = generate_nonogram(self.grid_height, self.grid_width, density=0.5)
+    def show_puzzle(self, puzzle):
+        grid, row_clues, column_clues = puzzle
         self.solution_grid = grid  # Store the correct solution grid
-        
-        # Define vibrant quadrant colors
-        quadrant_colors = [
-            (0.4, 0.7, 1, 1),  # Vibrant blue
-            (0.4, 1, 0.4, 1),  # Vibrant green
-            (1, 0.4, 0.4, 1),  # Vibrant red
-            (1, 1, 0.4, 1)     # Vibrant yellow
-        ]
-        
-        max_row_clues_len = max(len(clue) for clue in row_clues)
-        max_col_clues_len = max(len(clue) for clue in column_clues)
-
-        cell_size = min(self.screen_width // (self.grid_width + max_row_clues_len + 2), 
-                        (self.screen_height * 0.6) // (self.grid_height + max_col_clues_len + 2))
-
-        # Ensure that the grid has the correct number of rows and columns
-        self.grid_layout.cols = self.grid_width + max_row_clues_len
-        self.grid_layout.rows = self.grid_height + max_col_clues_len
-
-        # Add column clues
-        for i in range(max_col_clues_len):
-            for j in range(max_row_clues_len):
-                self.grid_layout.add_widget(Label(text="", size_hint_y=None, height=cell_size // 2))
-            for clue in column_clues:
-                if i < max_col_clues_len - len(clue):
-                    self.grid_layout.add_widget(Label(text="", size_hint_y=None, height=cell_size // 2)) 
-                else:
-                    self.grid_layout.add_widget(Label(text=str(clue[i - (max_col_clues_len - len(clue))]), font_size='12sp', size_hint_y=None, height=cell_size // 2))
-
-        # Add row clues and grid cells
-        self.cells = []  # Store references to the cells for checking progress
-        for i, row in enumerate(grid):
-            for j in range(max_row_clues_len):
-                if j < max_row_clues_len - len(row_clues[i]):
-                    self.grid_layout.add_widget(Label(text="", size_hint_y=None, height=cell_size))
-                else:
-                    self.grid_layout.add_widget(Label(text=str(row_clues[i][j - (max_row_clues_len - len(row_clues[i]))]), font_size='12sp', size_hint_y=None, height=cell_size))
-
-            for j, cell in enumerate(row):
-                q_index = (i // (self.grid_height // 2)) * 2 + (j // (self.grid_width // 2))  # Determine quadrant index
-                nonogram_cell = NonogramCell(quadrant_colors[q_index], size_hint=(None, None), size=(cell_size, cell_size))
-                self.cells.append(nonogram_cell)
-                self.grid_layout.add_widget(nonogram_cell)
-        
+        self.progress = ProgressTracker(grid, row_clues, column_clues)
+
+        # Redraw the board with the new clues and blank cells
+        self.board.set_puzzle(row_clues, column_clues)
+
         # Reset the result label
-        self.result_label.text = "Correctly shaded cells: 0 / 0 | Incorrectly shaded cells: 0"
+        self.result_label.text = self.progress.summary()
 
         # Calculate adjacent shaded cells for the solution grid
         self.adjacent_counts = calculate_adjacent_shaded(self.solution_grid)
 
-        # Update grid layout size
-        self.grid_layout.size = (self.grid_width * cell_size + max_row_clues_len * cell_size, self.grid_height * cell_size + max_col_clues_len * cell_size)
+    def cell_color(self, row, col, state):
+        q_index = (row // (self.board.grid_height // 2)) * 2 + (col // (self.board.grid_width // 2))  # Determine quadrant index
+        quadrant_color = self.quadrant_colors[q_index]
+        if state == 1:  # Shaded
+            return [c * 0.6 for c in quadrant_color]  # Darker shade of the vibrant quadrant color
+        return quadrant_color
+
+    def on_cell_state(self, board, row, col, cell_state):
+        # Keep the progress counts current on every click
+        self.progress.set_state(row, col, cell_state)
+        self.result_label.text = self.progress.summary()
 
     def check_progress(self, *args):
-        correct_count = 0
-        incorrect_count = 0
-        total_correct = sum(sum(row) for row in self.solution_grid)  # Total number of correct shaded cells
-        
-        for i, cell in enumerate(self.cells):
-            row = i // self.grid_width
-            col = i % self.grid_width
-            if self.solution_grid[row][col] == 1:
-                if cell.cell_state == 1:
-                    correct_count += 1
-                elif cell.cell_state == 0:
-                    pass  # Unshaded and should be unshaded, so do nothing
-                else:
-                    incorrect_count += 1  # X-ed or shaded when it shouldn't be
-            elif cell.cell_state == 1:
-                incorrect_count += 1  # Shaded when it should be unshaded
-
-        # Update result label with the latest count
-        self.result_label.text = f"Correctly shaded cells: {correct_count} / {total_correct} | Incorrectly shaded cells: {incorrect_count}"
+        self.result_label.text = self.progress.summary()
 
     def suggest_move(self, *args):
-        # Find the cell with the most adjacent shaded cells that is not yet shaded
+        # Ask the hint engine for a move that follows from the clues and the current marks;
+        # it gives up after its time budget so a big board never stalls the UI
+        hint = find_hint(self.board.row_clues, self.board.column_clues, self.board.states,
+                         time_budget=HINT_TIME_BUDGET)
+        if hint is not None:
+            self.result_label.text = describe_hint(hint)
+            return
+
+        # Fall back to the cell with the most adjacent shaded cells that is not yet shaded
         max_adjacent = -1
         suggestion = None
 
-        for i, cell in enumerate(self.cells):
-            row = i // self.grid_width
-            col = i % self.grid_width
-            if self.solution_grid[row][col] == 1 and cell.cell_state == 0:
-                if self.adjacent_counts[row][col] > max_adjacent:
-                    max_adjacent = self.adjacent_counts[row][col]
-                    suggestion = (row, col)
+        for row in range(self.grid_height):
+            for col in range(self.grid_width):
+                if self.solution_grid[row][col] == 1 and self.board.states[row][col] == 0:
+                    if self.adjacent_counts[row][col] > max_adjacent:
+                        max_adjacent = self.adjacent_counts[row][col]
+                        suggestion = (row, col)
 
         if suggestion:
             row, col = suggestion
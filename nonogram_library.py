@@ -0,0 +1,347 @@
+import hashlib
+import mmap
+import os
+import random
+import struct
+import sys
+from array import array
+from collections import namedtuple
+
+from nonogram import validate_nonogram
+from puzzle_grading import LEVELS
+
+# On-disk puzzle library. A library is a directory holding
+#
+#   puzzles.bin        a fixed header followed by puzzle records, only ever
+#                      appended to
+#   index/HxW.idx      offsets (little-endian uint64) of every HxW puzzle
+#   index/HxW-LEVEL.idx  offsets of the HxW puzzles graded LEVEL
+#   index/seeds.idx    (seed hash, offset) pairs
+#
+# Each record is a RECORD header (record length, height, width, level,
+# seed length), the seed as UTF-8, the grid packed one bit per cell in the
+# bit order of Nonogram.bits, then the row and column clues as uint16
+# values, each clue prefixed by its length. Files are read through mmap, so
+# picking a random puzzle of a size reads one index slot and one record no
+# matter how large the library is. The seed index is read into a dict the
+# first time a seed is looked up, and only the entries appended since are
+# read on later lookups.
+
+MAGIC = b"NONOGRAM"
+VERSION = 1
+HEADER = struct.Struct("<8sHHI")  # magic, version, record header size, reserved
+RECORD = struct.Struct("<IHHBH")  # record length, height, width, level, seed length
+OFFSET = struct.Struct("<Q")
+SEED_ENTRY = struct.Struct("<QQ")  # seed hash, offset
+
+# level byte: 0 for ungraded puzzles, otherwise 1 + the position in LEVELS
+LibraryPuzzle = namedtuple("LibraryPuzzle", "grid row_clues column_clues seed level")
+
+
+def _seed_hash(seed):
+    return int.from_bytes(hashlib.blake2b(str(seed).encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def pack_record(grid, row_clues, column_clues, seed="", level=None):
+    """Encode one puzzle as a library record."""
+    height, width = len(grid), len(grid[0])
+    bits = 0
+    for r, row in enumerate(grid):
+        for c, cell in enumerate(row):
+            if cell:
+                bits |= 1 << (r * width + c)
+    seed_bytes = str(seed).encode("utf-8")
+    clues = array("H")
+    for clue in list(row_clues) + list(column_clues):
+        clues.append(len(clue))
+        clues.extend(clue)
+    body = seed_bytes + bits.to_bytes((height * width + 7) // 8, "little") + clues.tobytes()
+    level_byte = 0 if level is None else LEVELS.index(level) + 1
+    return RECORD.pack(RECORD.size + len(body), height, width, level_byte, len(seed_bytes)) + body
+
+
+def unpack_record(buffer, offset=0):
+    """Decode the record at `offset` of a bytes-like object into a LibraryPuzzle."""
+    length, height, width, level_byte, seed_len = RECORD.unpack_from(buffer, offset)
+    pos = offset + RECORD.size
+    seed = bytes(buffer[pos:pos + seed_len]).decode("utf-8")
+    pos += seed_len
+    grid_len = (height * width + 7) // 8
+    bits = int.from_bytes(buffer[pos:pos + grid_len], "little")
+    pos += grid_len
+    mask = (1 << width) - 1
+    grid = []
+    for r in range(height):
+        row = (bits >> (r * width)) & mask
+        grid.append([(row >> c) & 1 for c in range(width)])
+    clues = array("H")
+    clues.frombytes(buffer[pos:offset + length])
+    lines = []
+    pos = 0
+    for _ in range(height + width):
+        n = clues[pos]
+        lines.append(clues[pos + 1:pos + 1 + n].tolist())
+        pos += 1 + n
+    level = LEVELS[level_byte - 1] if level_byte else None
+    return LibraryPuzzle(grid, lines[:height], lines[height:], seed, level)
+
+
+class _Mapped:
+    # A file read through mmap, remapped when it has grown since the last
+    # look. An older map is not closed when the file is remapped: whoever
+    # still holds it (a running iteration, say) keeps reading it, and it is
+    # unmapped once the last reference goes away
+    def __init__(self, path):
+        self.path = path
+        self.map = None
+
+    def view(self):
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size and (self.map is None or len(self.map) < size):
+            # mmap keeps its own handle on the file
+            with open(self.path, "rb") as f:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map if self.map is not None else b""
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+
+class PuzzleLibrary:
+    """A directory of puzzles with O(1) random access by size and level.
+
+    Open with mode "r" to read or "a" to read and append. Use as a context
+    manager or call close().
+    """
+
+    def __init__(self, path, mode="r"):
+        if mode not in ("r", "a"):
+            raise ValueError(f"mode must be 'r' or 'a', got {mode!r}")
+        self.path = path
+        self.mode = mode
+        self._data_path = os.path.join(path, "puzzles.bin")
+        self._index_dir = os.path.join(path, "index")
+        if mode == "a":
+            os.makedirs(self._index_dir, exist_ok=True)
+            if not os.path.exists(self._data_path) or not os.path.getsize(self._data_path):
+                with open(self._data_path, "wb") as f:
+                    f.write(HEADER.pack(MAGIC, VERSION, RECORD.size, 0))
+        with open(self._data_path, "rb") as f:
+            magic, version, record_size, _ = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            raise ValueError(f"{self._data_path} is not a version {VERSION} puzzle library")
+        self._data = _Mapped(self._data_path)
+        self._indexes = {}
+        self._seeds = {}  # seed hash -> offsets of the records with that hash
+        self._seeds_read = 0  # bytes of seeds.idx already in _seeds
+        self._appender = open(self._data_path, "ab") if mode == "a" else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._appender is not None:
+            self._appender.close()
+            self._appender = None
+        self._data.close()
+        for index in self._indexes.values():
+            index.close()
+        self._indexes.clear()
+
+    def _index(self, name):
+        index = self._indexes.get(name)
+        if index is None:
+            index = self._indexes[name] = _Mapped(os.path.join(self._index_dir, name))
+        return index
+
+    @staticmethod
+    def _bucket(height, width, level=None):
+        return f"{height}x{width}.idx" if level is None else f"{height}x{width}-{level}.idx"
+
+    def append(self, grid, row_clues, column_clues, seed="", level=None):
+        """Append one puzzle and index it; returns its offset."""
+        return self.append_records([pack_record(grid, row_clues, column_clues, seed, level)])[0]
+
+    def append_records(self, records):
+        """Append already packed records and index them; returns their offsets.
+
+        Records are written and flushed before their index entries, so an
+        interrupted write can leave an unindexed record behind but never an
+        index entry pointing past the data.
+        """
+        if self._appender is None:
+            raise ValueError("library was opened read-only")
+        records = list(records)
+        offset = self._appender.seek(0, os.SEEK_END)
+        offsets = []
+        for record in records:
+            offsets.append(offset)
+            offset += len(record)
+        self._appender.write(b"".join(records))
+        self._appender.flush()
+
+        entries = {}
+        seeds = []
+        for offset, record in zip(offsets, records):
+            _, height, width, level_byte, seed_len = RECORD.unpack_from(record)
+            entries.setdefault(self._bucket(height, width), []).append(OFFSET.pack(offset))
+            if level_byte:
+                entries.setdefault(self._bucket(height, width, LEVELS[level_byte - 1]), []).append(OFFSET.pack(offset))
+            seed = record[RECORD.size:RECORD.size + seed_len].decode("utf-8")
+            seeds.append(SEED_ENTRY.pack(_seed_hash(seed), offset))
+        entries["seeds.idx"] = seeds
+        for name, packed in entries.items():
+            with open(os.path.join(self._index_dir, name), "ab") as f:
+                f.write(b"".join(packed))
+        return offsets
+
+    def append_batch(self, grids, row_clues, column_clues, seeds=None, level=None):
+        """Append a batch from nonogram_batch.generate_nonograms (a boolean array of grids)."""
+        import numpy as np
+
+        grids = np.asarray(grids, dtype=bool)
+        count, height, width = grids.shape
+        # One bit per cell, row-major, least significant bit first: the same
+        # layout pack_record builds one cell at a time
+        packed = np.packbits(grids.reshape(count, height * width), axis=1, bitorder="little")
+        level_byte = 0 if level is None else LEVELS.index(level) + 1
+        records = []
+        for k in range(count):
+            seed_bytes = str(seeds[k] if seeds is not None else "").encode("utf-8")
+            clues = array("H")
+            for clue in list(row_clues[k]) + list(column_clues[k]):
+                clues.append(len(clue))
+                clues.extend(clue)
+            body = seed_bytes + packed[k].tobytes() + clues.tobytes()
+            records.append(RECORD.pack(RECORD.size + len(body), height, width, level_byte, len(seed_bytes)) + body)
+        return self.append_records(records)
+
+    def get(self, offset):
+        """Read the puzzle stored at `offset`."""
+        return unpack_record(self._data.view(), offset)
+
+    def count(self, height, width, level=None):
+        """Number of indexed puzzles of a size (and level)."""
+        return len(self._index(self._bucket(height, width, level)).view()) // OFFSET.size
+
+    def offsets(self, height, width, level=None):
+        view = self._index(self._bucket(height, width, level)).view()
+        return [offset for (offset,) in OFFSET.iter_unpack(view)]
+
+    def random_puzzle(self, height, width, level=None, rng=random):
+        """A random puzzle of the given size (and level), or None if the library has none."""
+        view = self._index(self._bucket(height, width, level)).view()
+        n = len(view) // OFFSET.size
+        if not n:
+            return None
+        (offset,) = OFFSET.unpack_from(view, rng.randrange(n) * OFFSET.size)
+        return self.get(offset)
+
+    def find_seed(self, seed):
+        """The puzzle generated from `seed`, or None.
+
+        A lookup is a dict lookup plus reading the matching record; the seed
+        index is only read in full the first time.
+        """
+        view = self._index("seeds.idx").view()
+        end = len(view) - len(view) % SEED_ENTRY.size
+        if end > self._seeds_read:
+            entries = array("Q")
+            entries.frombytes(view[self._seeds_read:end])
+            if sys.byteorder == "big":
+                entries.byteswap()
+            for key, offset in zip(entries[0::2], entries[1::2]):
+                self._seeds.setdefault(key, []).append(offset)
+            self._seeds_read = end
+        for offset in self._seeds.get(_seed_hash(seed), ()):
+            puzzle = self.get(offset)
+            if puzzle.seed == str(seed):
+                return puzzle
+        return None
+
+    def sizes(self):
+        """The (height, width) sizes present in the library."""
+        if not os.path.isdir(self._index_dir):
+            return []
+        sizes = []
+        for name in sorted(os.listdir(self._index_dir)):
+            stem = name[:-len(".idx")]
+            if name.endswith(".idx") and "x" in stem and "-" not in stem:
+                height, width = stem.split("x")
+                sizes.append((int(height), int(width)))
+        return sizes
+
+    def __iter__(self):
+        # Every stored record in file order, indexed or not. A record cut off
+        # at the end of the file (an interrupted append) ends the iteration; a
+        # record header too short to hold itself would never move on, so it
+        # is reported as corruption
+        view = self._data.view()
+        offset = HEADER.size
+        while offset + RECORD.size <= len(view):
+            length = RECORD.unpack_from(view, offset)[0]
+            if length < RECORD.size:
+                raise ValueError(f"corrupt record header at offset {offset} (length {length})")
+            if offset + length > len(view):
+                break
+            yield unpack_record(view, offset)
+            offset += length
+
+    def check(self):
+        """Check the whole library; returns a list of problems (empty if all is well).
+
+        Every record must decode and pass validate_nonogram against its stored
+        clues, and every index entry must point at the start of a record of
+        the right size and level.
+        """
+        problems = []
+        view = self._data.view()
+        starts = {}
+        offset = HEADER.size
+        while offset + RECORD.size <= len(view):
+            length, height, width, level_byte, _ = RECORD.unpack_from(view, offset)
+            if length < RECORD.size or offset + length > len(view):
+                break
+            try:
+                puzzle = unpack_record(view, offset)
+            except (ValueError, IndexError, UnicodeDecodeError) as exc:
+                problems.append(f"unreadable record at offset {offset}: {exc}")
+            else:
+                if not validate_nonogram(puzzle.grid, puzzle.row_clues, puzzle.column_clues):
+                    problems.append(f"record at offset {offset} does not match its clues")
+            starts[offset] = (height, width, LEVELS[level_byte - 1] if level_byte else None)
+            offset += length
+        if offset + RECORD.size <= len(view) and RECORD.unpack_from(view, offset)[0] < RECORD.size:
+            problems.append(f"corrupt record header at offset {offset}")
+        elif offset < len(view):
+            problems.append(f"truncated record at offset {offset}")
+
+        indexed = set()
+        if os.path.isdir(self._index_dir):
+            for name in sorted(os.listdir(self._index_dir)):
+                if not name.endswith(".idx"):
+                    continue
+                view = self._index(name).view()
+                if name == "seeds.idx":
+                    entries = [entry[1] for entry in SEED_ENTRY.iter_unpack(view)]
+                else:
+                    entries = [entry[0] for entry in OFFSET.iter_unpack(view)]
+                for offset in entries:
+                    if offset not in starts:
+                        problems.append(f"{name} points at {offset}, which is not a record")
+                        continue
+                    indexed.add(offset)
+                    if name == "seeds.idx":
+                        continue
+                    height, width, level = starts[offset]
+                    if name not in (self._bucket(height, width), self._bucket(height, width, level)):
+                        problems.append(f"{name} points at a {height}x{width} {level or 'ungraded'} puzzle")
+        for offset in starts:
+            if offset not in indexed:
+                problems.append(f"record at offset {offset} is not indexed")
+        return problems
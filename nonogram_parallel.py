@@ -0,0 +1,184 @@
+import multiprocessing
+import os
+import queue
+
+import instrumentation
+from nonogram_solver import COLUMN, EMPTY, FILLED, ROW, Board, _branch_cell, apply_overlaps, probe, propagate
+
+# Backtracking search over a process pool, for puzzles that line logic and
+# probing cannot finish (random grids at density 0.5 often are). Every node of
+# the search is probed before it branches, which keeps the tree small. Open
+# nodes travel between processes as their four lists of bitmasks.
+#
+# The workers share one task queue. A worker runs a depth-first search on the
+# node it took and, whenever the queue runs dry, gives away the oldest node on
+# its own stack (the biggest unexplored subtree), so idle workers steal work
+# instead of waiting. A shared Event stops every worker as soon as `limit`
+# solutions have been found or the branch budget runs out.
+
+# How long an idle worker or the parent waits on a queue before checking
+# whether the search is over
+POLL_SECONDS = 0.05
+
+
+def _state(board):
+    return board.row_filled, board.row_empty, board.col_filled, board.col_empty
+
+
+def _board(template, state):
+    board = template.copy()
+    board.row_filled, board.row_empty, board.col_filled, board.col_empty = (list(masks) for masks in state)
+    return board
+
+
+def _expand(board, stack):
+    # Probe a node; returns "solved", "dead" or "branched" (children pushed on
+    # `stack`, FILLED to be explored first)
+    if not probe(board):
+        return "dead"
+    cell = _branch_cell(board)
+    if cell is None:
+        return "solved"
+    row, col = cell
+    for value in (EMPTY, FILLED):
+        branch = board.copy()
+        branch.set_cell(row, col, value)
+        if propagate(branch, [(ROW, row), (COLUMN, col)]):
+            stack.append(branch)
+    return "branched"
+
+
+def _worker(row_clues, column_clues, tasks, results, pending, found, branches, stop, limit, max_branches):
+    # Results are ("solution", row_filled) or ("budget", None). A worker may
+    # exit with nodes it gave away still unread once the search is over, so
+    # it must not wait for them to be flushed
+    tasks.cancel_join_thread()
+    template = Board(row_clues, column_clues)
+    while not stop.is_set():
+        try:
+            state = tasks.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            if pending.value == 0:
+                return
+            continue
+        stack = [_board(template, state)]
+        while stack and not stop.is_set():
+            board = stack.pop()
+            outcome = _expand(board, stack)
+            if outcome == "solved":
+                results.put(("solution", board.row_filled))
+                with found.get_lock():
+                    found.value += 1
+                    if found.value >= limit:
+                        stop.set()
+            elif outcome == "branched":
+                with branches.get_lock():
+                    branches.value += 1
+                    over_budget = max_branches is not None and branches.value > max_branches
+                if over_budget:
+                    results.put(("budget", None))
+                    stop.set()
+                elif len(stack) > 1 and tasks.empty():
+                    # Share the biggest open subtree with whoever is idle
+                    with pending.get_lock():
+                        pending.value += 1
+                    tasks.put(_state(stack.pop(0)))
+        with pending.get_lock():
+            pending.value -= 1
+
+
+def _grid(board, row_filled):
+    # A solution as a grid of 0 and 1
+    return [[(bits >> j) & 1 for j in range(board.width)] for bits in row_filled]
+
+
+def count_solutions_parallel(row_clues, column_clues, limit=2, max_branches=None, workers=None):
+    """Count the solutions of a puzzle like nonogram_solver.count_solutions, using several processes.
+
+    Line logic and probing run first in this process; only if they leave
+    cells undecided is a pool of `workers` processes (default: one per core)
+    started to search the rest. Returns (count, solutions) with at most
+    `limit` solution grids; count is None if the search needed more than
+    `max_branches` branch points. Use limit=1 to solve and limit=2 to check
+    uniqueness.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    root = Board(row_clues, column_clues)
+    dirty = apply_overlaps(root)
+    if dirty is None or not propagate(root, dirty) or not probe(root):
+        return 0, []
+    if root.is_solved():
+        return 1, [_grid(root, root.row_filled)]
+    if workers <= 1:
+        return _count_here(root, limit, max_branches)
+
+    if instrumentation.enabled:
+        instrumentation.count("parallel_searches")
+    tasks = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    pending = multiprocessing.Value("i", 1)
+    found = multiprocessing.Value("i", 0)
+    branches = multiprocessing.Value("i", 0)
+    stop = multiprocessing.Event()
+    tasks.put(_state(root))
+    processes = [multiprocessing.Process(target=_worker, daemon=True,
+                                         args=(root.row_clues, root.column_clues, tasks, results, pending,
+                                               found, branches, stop, limit, max_branches))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+
+    solutions = []
+    over_budget = False
+    try:
+        # Keep reading while any worker runs; a worker only exits once its
+        # results are flushed, so a last read afterwards catches the rest
+        while True:
+            alive = any(process.is_alive() for process in processes)
+            try:
+                kind, row_filled = results.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                if not alive:
+                    break
+                continue
+            if kind == "budget":
+                over_budget = True
+            elif len(solutions) < limit:
+                solutions.append(_grid(root, row_filled))
+    finally:
+        stop.set()
+        for process in processes:
+            process.join()
+    if instrumentation.enabled:
+        instrumentation.count("branches", branches.value)
+    if over_budget and len(solutions) < limit:
+        return None, solutions
+    return len(solutions), solutions
+
+
+def _count_here(root, limit, max_branches):
+    # The same search in this process, for workers=1
+    solutions = []
+    branches = 0
+    stack = [root]
+    while stack:
+        board = stack.pop()
+        outcome = _expand(board, stack)
+        if outcome == "solved":
+            solutions.append(_grid(board, board.row_filled))
+            if len(solutions) >= limit:
+                break
+        elif outcome == "branched":
+            branches += 1
+            if max_branches is not None and branches > max_branches:
+                return None, solutions
+    if instrumentation.enabled:
+        instrumentation.count("branches", branches)
+    return len(solutions), solutions
+
+
+def solve_parallel(row_clues, column_clues, workers=None):
+    """Return one solution grid of the puzzle, or None if it has none."""
+    count, solutions = count_solutions_parallel(row_clues, column_clues, limit=1, workers=workers)
+    return solutions[0] if solutions else None
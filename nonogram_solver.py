@@ -0,0 +1,571 @@
+import functools
+import time
+from collections import deque
+
+import instrumentation
+
+# Cell values used in solver output grids. Filled and empty match the 1/0
+# convention of the generated grids; undecided cells are reported as UNKNOWN.
+UNKNOWN = -1
+EMPTY = 0
+FILLED = 1
+
+ROW = 0
+COLUMN = 1
+
+
+def normalize_clue(clue):
+    """Turn a clue from calculate_clues ([0] for a blank line) into a tuple of block lengths."""
+    return tuple(block for block in clue if block)
+
+
+def overlap_line(clue, length):
+    """Leftmost/rightmost overlap for a line with no known cells.
+
+    Returns (filled, empty) bitmasks, bit j standing for cell j. For a blank
+    line this is already the complete set of deductions, so the full line
+    solver only has to look at lines once crossing lines have touched them.
+    """
+    full = (1 << length) - 1
+    if not clue:
+        return 0, full
+    slack = length - (sum(clue) + len(clue) - 1)
+    if slack < 0:
+        return None
+    filled = 0
+    start = 0
+    for block in clue:
+        if block > slack:
+            filled |= ((1 << (block - slack)) - 1) << (start + slack)
+        start += block + 1
+    # With no slack the blocks are pinned and every gap between them is empty
+    empty = full & ~filled if slack == 0 else 0
+    return filled, empty
+
+
+def _fill_up(seeds, steps):
+    # Spread every seed bit towards higher positions while the step bit is set.
+    # Within each run of (steps | seeds) everything from the lowest seed up is
+    # reachable; the part below it is found with one carry-propagating add.
+    reach = steps | seeds
+    rest = reach & ~seeds
+    run_starts = reach & ~(reach << 1) & rest
+    unreached = ((rest + run_starts) ^ rest) & rest
+    return reach & ~unreached
+
+
+def _fill_down(seeds, steps, length):
+    # Spread every seed bit towards lower positions while the step bit is set
+    shift = 1
+    while shift <= length and steps:
+        seeds |= steps & (seeds >> shift)
+        steps &= steps >> shift
+        shift <<= 1
+    return seeds
+
+
+def _window_starts(free, block):
+    # Bit s is set when cells s .. s+block-1 are all set in `free`
+    covered = 1
+    while covered < block:
+        step = min(covered, block - covered)
+        free &= free >> step
+        covered += step
+    return free
+
+
+def _smear(starts, block):
+    # Bit j is set when some start s with s <= j < s+block is set
+    covered = 1
+    while covered < block:
+        step = min(covered, block - covered)
+        starts |= starts << step
+        covered += step
+    return starts
+
+
+def solve_line(clue, length, filled, empty):
+    """Full line solver: every deduction that follows from one line alone.
+
+    `clue` is a normalized clue tuple, `filled`/`empty` are bitmasks of the
+    known cells. Returns the refined (filled, empty) pair, or None when no
+    placement of the blocks agrees with the known cells.
+
+    This is the usual prefix/suffix placement DP, run on bitsets over cell
+    positions so each block costs a handful of big-int operations instead of
+    a loop over the line.
+    """
+    full = (1 << length) - 1
+    if not clue:
+        if filled:
+            return None
+        return 0, full
+
+    count = len(clue)
+    not_filled = full & ~filled
+    not_empty = full & ~empty
+    starts_by_block = {}
+    for block in set(clue):
+        starts_by_block[block] = _window_starts(not_empty, block) if block <= length else 0
+
+    # prefix[i] bit p: blocks 0..i-1 fit in cells [0, p)
+    first_filled = (filled & -filled).bit_length() - 1 if filled else length
+    prefix = [(1 << (first_filled + 1)) - 1]
+    steps_up = not_filled << 1
+    for i in range(count):
+        block = clue[i]
+        if i == 0:
+            left = prefix[0]
+        else:
+            left = (prefix[i] & not_filled) << 1
+        seeds = (starts_by_block[block] & left) << block
+        prefix.append(_fill_up(seeds, steps_up) & ((full << 1) | 1))
+    if not (prefix[count] >> length) & 1:
+        return None
+
+    # suffix[i] bit p: blocks i..count-1 fit in cells [p, length)
+    last_filled = filled.bit_length() - 1
+    suffix = [0] * (count + 1)
+    suffix[count] = ((full << 1) | 1) & ~((1 << (last_filled + 1)) - 1)
+    right_ok = [0] * count
+    for i in range(count - 1, -1, -1):
+        block = clue[i]
+        if i == count - 1:
+            right = suffix[count] >> block
+        else:
+            right = ((suffix[i + 1] >> 1) & not_filled) >> block
+        right_ok[i] = starts_by_block[block] & right
+        suffix[i] = _fill_down(right_ok[i], not_filled, length)
+
+    can_fill = 0
+    for i in range(count):
+        block = clue[i]
+        if i == 0:
+            left = prefix[0]
+        else:
+            left = (prefix[i] & not_filled) << 1
+        can_fill |= _smear(right_ok[i] & left, block)
+
+    can_empty = 0
+    for i in range(count + 1):
+        can_empty |= prefix[i] & (suffix[i] >> 1)
+    can_empty &= not_filled
+
+    return full & ~can_empty, full & ~can_fill
+
+
+def make_line_cache(maxsize=1 << 16):
+    """Wrap solve_line in an LRU cache holding at most `maxsize` line results.
+
+    Keys are (clue, length, filled, empty), so the same partial line is only
+    solved once across all puzzles sharing the cache. The returned function
+    takes the same arguments as solve_line and exposes the hit/miss counters
+    through cache_info() and cache_clear().
+    """
+    return functools.lru_cache(maxsize=maxsize)(solve_line)
+
+
+# Shared by the solver entry points and the hint system unless they are
+# given their own line_solver
+line_cache = make_line_cache()
+
+
+def configure_line_cache(maxsize):
+    """Replace the shared line cache with an empty one of a different size."""
+    global line_cache
+    line_cache = make_line_cache(maxsize)
+    return line_cache
+
+
+class Board:
+    """Partial solution of a puzzle, one filled and one empty bitmask per row and column."""
+
+    __slots__ = ("height", "width", "row_clues", "column_clues",
+                 "row_filled", "row_empty", "col_filled", "col_empty", "conflict")
+
+    def __init__(self, row_clues, column_clues):
+        self.height = len(row_clues)
+        self.width = len(column_clues)
+        self.row_clues = [normalize_clue(clue) for clue in row_clues]
+        self.column_clues = [normalize_clue(clue) for clue in column_clues]
+        self.row_filled = [0] * self.height
+        self.row_empty = [0] * self.height
+        self.col_filled = [0] * self.width
+        self.col_empty = [0] * self.width
+        # (axis, index) of the line that had no valid placement, set by propagate
+        self.conflict = None
+
+    def copy(self):
+        other = Board.__new__(Board)
+        other.height = self.height
+        other.width = self.width
+        other.row_clues = self.row_clues
+        other.column_clues = self.column_clues
+        other.row_filled = self.row_filled[:]
+        other.row_empty = self.row_empty[:]
+        other.col_filled = self.col_filled[:]
+        other.col_empty = self.col_empty[:]
+        other.conflict = None
+        return other
+
+    def cell(self, row, col):
+        bit = 1 << col
+        if self.row_filled[row] & bit:
+            return FILLED
+        if self.row_empty[row] & bit:
+            return EMPTY
+        return UNKNOWN
+
+    def set_cell(self, row, col, value):
+        """Record a cell value; returns False if it contradicts what is already known."""
+        row_bit = 1 << col
+        col_bit = 1 << row
+        if value == FILLED:
+            if self.row_empty[row] & row_bit:
+                return False
+            self.row_filled[row] |= row_bit
+            self.col_filled[col] |= col_bit
+        else:
+            if self.row_filled[row] & row_bit:
+                return False
+            self.row_empty[row] |= row_bit
+            self.col_empty[col] |= col_bit
+        return True
+
+    def unknown_count(self):
+        full = (1 << self.width) - 1
+        return sum(self.width - bin((filled | empty) & full).count("1")
+                   for filled, empty in zip(self.row_filled, self.row_empty))
+
+    def is_solved(self):
+        full = (1 << self.width) - 1
+        return all((filled | empty) == full for filled, empty in zip(self.row_filled, self.row_empty))
+
+    def to_grid(self):
+        grid = []
+        for filled, empty in zip(self.row_filled, self.row_empty):
+            row = []
+            for j in range(self.width):
+                if (filled >> j) & 1:
+                    row.append(FILLED)
+                elif (empty >> j) & 1:
+                    row.append(EMPTY)
+                else:
+                    row.append(UNKNOWN)
+            grid.append(row)
+        return grid
+
+
+def apply_overlaps(board):
+    """Seed a blank board with the overlap deductions of every line.
+
+    Returns the list of lines that picked up cells from crossing lines and so
+    still need the full line solver, or None on a contradiction.
+    """
+    own_rows = []
+    for i, clue in enumerate(board.row_clues):
+        result = overlap_line(clue, board.width)
+        if result is None:
+            return None
+        own_rows.append(result)
+        board.row_filled[i], board.row_empty[i] = result
+    own_cols = []
+    for j, clue in enumerate(board.column_clues):
+        result = overlap_line(clue, board.height)
+        if result is None:
+            return None
+        own_cols.append(result)
+        board.col_filled[j], board.col_empty[j] = result
+
+    # Merge the two directions so both views of every cell agree
+    for i in range(board.height):
+        bit = 1 << i
+        filled = board.row_filled[i]
+        empty = board.row_empty[i]
+        for j in range(board.width):
+            if board.col_filled[j] & bit:
+                filled |= 1 << j
+            elif board.col_empty[j] & bit:
+                empty |= 1 << j
+        if filled & empty:
+            return None
+        board.row_filled[i] = filled
+        board.row_empty[i] = empty
+    for j in range(board.width):
+        bit = 1 << j
+        filled = 0
+        empty = 0
+        for i in range(board.height):
+            if board.row_filled[i] & bit:
+                filled |= 1 << i
+            elif board.row_empty[i] & bit:
+                empty |= 1 << i
+        board.col_filled[j] = filled
+        board.col_empty[j] = empty
+
+    dirty = []
+    for i, own in enumerate(own_rows):
+        if (board.row_filled[i], board.row_empty[i]) != own:
+            dirty.append((ROW, i))
+    for j, own in enumerate(own_cols):
+        if (board.col_filled[j], board.col_empty[j]) != own:
+            dirty.append((COLUMN, j))
+    return dirty
+
+
+def propagate(board, dirty, line_solver=None, deadline=None, stats=None):
+    """Run the line solver over a work queue of dirty lines until nothing changes.
+
+    Only lines crossing a newly decided cell are queued again. Updates `board`
+    in place and returns False if some line has no valid placement; that line
+    is left in board.conflict. `line_solver` defaults to the shared line cache.
+    If `deadline` (a time.perf_counter() value) passes before the queue is
+    empty, TimeoutError is raised and the board is left part-way through.
+
+    If `stats` is a dict, a successful run adds to its "rounds" entry the
+    sweeps of the board it took (the lines made dirty by one round are solved
+    in the next, which is how a player works) and to "line_solves" the lines
+    it solved.
+    """
+    if line_solver is None:
+        line_solver = line_cache
+    if instrumentation.enabled:
+        instrumentation.count("propagations")
+    height = board.height
+    width = board.width
+    queued = [[False] * height, [False] * width]
+    queue = deque()
+    for axis, index in dirty:
+        if not queued[axis][index]:
+            queued[axis][index] = True
+            queue.append((axis, index))
+
+    # The queue is first in, first out, so a round ends once every line that
+    # was queued when it started has been taken off
+    rounds = 0
+    round_end = 0
+    solved = 0
+    while queue:
+        if solved == round_end:
+            rounds += 1
+            round_end = solved + len(queue)
+        solved += 1
+        axis, index = queue.popleft()
+        queued[axis][index] = False
+        if deadline is not None and time.perf_counter() > deadline:
+            raise TimeoutError("line propagation ran past its deadline")
+        if axis == ROW:
+            filled = board.row_filled[index]
+            empty = board.row_empty[index]
+            result = line_solver(board.row_clues[index], width, filled, empty)
+        else:
+            filled = board.col_filled[index]
+            empty = board.col_empty[index]
+            result = line_solver(board.column_clues[index], height, filled, empty)
+        if result is None:
+            board.conflict = (axis, index)
+            if instrumentation.enabled:
+                instrumentation.count("contradictions")
+            return False
+        new_filled, new_empty = result
+        changed = (new_filled & ~filled) | (new_empty & ~empty)
+        if not changed:
+            continue
+
+        if axis == ROW:
+            board.row_filled[index] = new_filled
+            board.row_empty[index] = new_empty
+            crossing_filled = board.col_filled
+            crossing_empty = board.col_empty
+        else:
+            board.col_filled[index] = new_filled
+            board.col_empty[index] = new_empty
+            crossing_filled = board.row_filled
+            crossing_empty = board.row_empty
+        crossing_axis = COLUMN if axis == ROW else ROW
+        crossing_queued = queued[crossing_axis]
+        bit = 1 << index
+        while changed:
+            low = changed & -changed
+            changed ^= low
+            j = low.bit_length() - 1
+            if new_filled & low:
+                crossing_filled[j] |= bit
+            else:
+                crossing_empty[j] |= bit
+            if not crossing_queued[j]:
+                crossing_queued[j] = True
+                queue.append((crossing_axis, j))
+    if stats is not None:
+        stats["rounds"] = stats.get("rounds", 0) + rounds
+        stats["line_solves"] = stats.get("line_solves", 0) + solved
+    return True
+
+
+def probe(board, line_solver=None, deadline=None, stats=None, max_deductions=None):
+    """Settle undecided cells by trying both values of each one.
+
+    A value that leads propagation into a contradiction is ruled out, and
+    cells that come out the same whichever value is tried are decided too.
+    Passes over the undecided cells repeat until one changes nothing, or
+    until `max_deductions` probes have decided something. Rows with the
+    fewest undecided cells are probed first. Updates `board` in place and
+    returns False if some cell has no consistent value (that line is left in
+    board.conflict). `deadline` works as in propagate.
+
+    If `stats` is a dict, its "deductions" entry counts the probes that
+    decided something, and the line logic that followed each of them is
+    added to "rounds" and "line_solves" as in propagate.
+    """
+    if line_solver is None:
+        line_solver = line_cache
+    full = (1 << board.width) - 1
+    deductions = 0
+    progress = True
+    while progress:
+        progress = False
+        rows = sorted(range(board.height),
+                      key=lambda i: bin(full & ~(board.row_filled[i] | board.row_empty[i])).count("1"))
+        for row in rows:
+            unknown = full & ~(board.row_filled[row] | board.row_empty[row])
+            while unknown:
+                low = unknown & -unknown
+                unknown ^= low
+                if (board.row_filled[row] | board.row_empty[row]) & low:
+                    continue  # decided by an earlier probe in this pass
+                col = low.bit_length() - 1
+                if instrumentation.enabled:
+                    instrumentation.count("probes")
+                # Each trial keeps its own stats; only the one that survives counts
+                filled_stats = {} if stats is not None else None
+                empty_stats = {} if stats is not None else None
+                filled = board.copy()
+                filled.set_cell(row, col, FILLED)
+                filled_ok = propagate(filled, [(ROW, row), (COLUMN, col)], line_solver, deadline, filled_stats)
+                empty = board.copy()
+                empty.set_cell(row, col, EMPTY)
+                empty_ok = propagate(empty, [(ROW, row), (COLUMN, col)], line_solver, deadline, empty_stats)
+                if not filled_ok and not empty_ok:
+                    board.conflict = filled.conflict
+                    return False
+                if filled_ok != empty_ok:
+                    # Only one value survives; its board is already propagated
+                    kept = filled if filled_ok else empty
+                    board.row_filled[:] = kept.row_filled
+                    board.row_empty[:] = kept.row_empty
+                    board.col_filled[:] = kept.col_filled
+                    board.col_empty[:] = kept.col_empty
+                    if stats is not None:
+                        kept_stats = filled_stats if filled_ok else empty_stats
+                        stats["rounds"] = stats.get("rounds", 0) + kept_stats["rounds"]
+                        stats["line_solves"] = stats.get("line_solves", 0) + kept_stats["line_solves"]
+                        stats["deductions"] = stats.get("deductions", 0) + 1
+                    deductions += 1
+                    if deductions == max_deductions:
+                        return True
+                    progress = True
+                    continue
+                # Both values survive; keep what they agree on
+                dirty = []
+                for i in range(board.height):
+                    agreed_filled = filled.row_filled[i] & empty.row_filled[i]
+                    agreed_empty = filled.row_empty[i] & empty.row_empty[i]
+                    if agreed_filled != board.row_filled[i] or agreed_empty != board.row_empty[i]:
+                        board.row_filled[i], board.row_empty[i] = agreed_filled, agreed_empty
+                        dirty.append((ROW, i))
+                for j in range(board.width):
+                    agreed_filled = filled.col_filled[j] & empty.col_filled[j]
+                    agreed_empty = filled.col_empty[j] & empty.col_empty[j]
+                    if agreed_filled != board.col_filled[j] or agreed_empty != board.col_empty[j]:
+                        board.col_filled[j], board.col_empty[j] = agreed_filled, agreed_empty
+                        dirty.append((COLUMN, j))
+                if dirty:
+                    if not propagate(board, dirty, line_solver, deadline, stats):
+                        return False
+                    if stats is not None:
+                        stats["deductions"] = stats.get("deductions", 0) + 1
+                    deductions += 1
+                    if deductions == max_deductions:
+                        return True
+                    progress = True
+    return True
+
+
+@instrumentation.timed("solve_nonogram")
+def solve_nonogram(row_clues, column_clues, line_solver=None):
+    """Solve a puzzle from its clues using line logic only.
+
+    Returns (status, grid) where status is "solved", "stuck" (line logic ran
+    out of deductions; undecided cells are UNKNOWN in the grid) or
+    "contradiction" (the clues have no solution).
+    """
+    board = Board(row_clues, column_clues)
+    dirty = apply_overlaps(board)
+    if dirty is None or not propagate(board, dirty, line_solver):
+        return "contradiction", None
+    status = "solved" if board.is_solved() else "stuck"
+    return status, board.to_grid()
+
+
+def _branch_cell(board):
+    # Branch on an undecided cell in the row with the fewest undecided cells;
+    # that row is the one closest to being forced by line logic.
+    full = (1 << board.width) - 1
+    best_row = -1
+    best_unknown = 0
+    best_count = board.width + 1
+    for i in range(board.height):
+        unknown = full & ~(board.row_filled[i] | board.row_empty[i])
+        if unknown:
+            count = bin(unknown).count("1")
+            if count < best_count:
+                best_row, best_unknown, best_count = i, unknown, count
+                if count == 1:
+                    break
+    if best_row < 0:
+        return None
+    return best_row, (best_unknown & -best_unknown).bit_length() - 1
+
+
+@instrumentation.timed("count_solutions")
+def count_solutions(row_clues, column_clues, limit=2, max_branches=None, line_solver=None):
+    """Count the solutions of a puzzle, stopping as soon as `limit` have been found.
+
+    Line logic runs first; when it gets stuck the search branches on one
+    undecided cell at a time and propagates each hypothesis. Returns
+    (count, solutions) with at most `limit` solution grids, so
+    `count_solutions(rows, cols)[0] == 1` means the puzzle is unique. If
+    `max_branches` is given and the search needs more branch points than
+    that, count is None.
+    """
+    board = Board(row_clues, column_clues)
+    dirty = apply_overlaps(board)
+    if dirty is None or not propagate(board, dirty, line_solver):
+        return 0, []
+
+    solutions = []
+    branches = 0
+    stack = [board]
+    while stack:
+        board = stack.pop()
+        cell = _branch_cell(board)
+        if cell is None:
+            solutions.append(board.to_grid())
+            if len(solutions) >= limit:
+                break
+            continue
+        branches += 1
+        if instrumentation.enabled:
+            instrumentation.count("branches")
+        if max_branches is not None and branches > max_branches:
+            if instrumentation.enabled:
+                instrumentation.count("branch_budget_exceeded")
+            return None, solutions
+        row, col = cell
+        # Push EMPTY first so FILLED is explored first
+        for value in (EMPTY, FILLED):
+            branch = board.copy()
+            branch.set_cell(row, col, value)
+            if propagate(branch, [(ROW, row), (COLUMN, col)], line_solver):
+                stack.append(branch)
+    return len(solutions), solutions
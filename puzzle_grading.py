@@ -0,0 +1,35 @@
+# Difficulty scale shared by the nonogram and Sudoku graders. Both replay a
+# logic solver over the puzzle; what counts as easy or medium depends on the
+# puzzle type, but the top two levels are decided the same way:
+#   hard    the basic techniques get stuck and a probe or two (assume a
+#           value, follow the basic techniques to a contradiction) gets them
+#           going again
+#   expert  needs more probes than that, or the solver has to guess
+LEVELS = ("easy", "medium", "hard", "expert")
+
+# Each probe counts as this many rounds in the score
+PROBE_WEIGHT = 5
+# Most probes a "hard" puzzle may need
+HARD_PROBES = 2
+
+
+def probe_level(probes, guessed):
+    """The level a puzzle is at because of its probes and guesses, or None if neither makes it hard."""
+    if guessed or probes > HARD_PROBES:
+        return "expert"
+    if probes:
+        return "hard"
+    return None
+
+
+def distance(grade, target):
+    """How far a grade is from the level LEVELS[target], for walks towards that level.
+
+    Within a level, a score pointing towards the target counts as closer.
+    """
+    index = LEVELS.index(grade.level)
+    if index < target:
+        return target - index, -grade.score
+    if index > target:
+        return index - target, grade.score
+    return 0, 0
@@ -0,0 +1,116 @@
+import sys
+import threading
+from collections import deque
+
+# Ready-made puzzles for the apps. A worker thread keeps a few puzzles
+# generated ahead of time, so pressing "new puzzle" hands one over at once
+# instead of generating on the UI thread. This module has no Kivy
+# dependency; the apps pass a `deliver` function that hands results back
+# through the Kivy clock.
+
+# Failed make() calls in a row after which the waiting callers get the error
+MAX_FAILURES = 3
+# Seconds to wait before retrying after a failure, doubling up to MAX_BACKOFF
+BACKOFF = 0.05
+MAX_BACKOFF = 2.0
+
+
+def _call(callback, puzzle):
+    callback(puzzle)
+
+
+class PuzzlePrefetcher:
+    """Keep up to `depth` results of `make()` ready, made on a background thread.
+
+    get(callback) calls callback(puzzle) at once if a puzzle is ready.
+    Otherwise the next puzzle the worker finishes goes to the callback
+    through deliver(callback, puzzle), which runs on the worker thread. GUI
+    code passes a deliver that schedules the call on its own thread instead.
+    Callbacks are served in the order they asked. If `make` raises, the
+    error is printed to stderr and the worker tries again after a growing
+    pause. Once MAX_FAILURES calls in a row have failed, every waiting
+    caller gets the error through deliver(on_error, error) instead of
+    waiting forever, and so does every later caller until `make` succeeds
+    again.
+    """
+
+    def __init__(self, make, depth=3, deliver=_call):
+        self.make = make
+        self.depth = depth
+        self.deliver = deliver
+        self._ready = deque()
+        self._waiting = deque()  # (callback, on_error) pairs
+        self._failures = 0
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="puzzle-prefetch", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped and len(self._ready) >= self.depth and not self._waiting:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+            try:
+                puzzle = self.make()
+            except Exception as exc:
+                self._failed(exc)
+                continue
+            with self._condition:
+                if self._stopped:
+                    return
+                self._failures = 0
+                callback = self._waiting.popleft()[0] if self._waiting else None
+                if callback is None:
+                    self._ready.append(puzzle)
+            if callback is not None:
+                self.deliver(callback, puzzle)
+
+    def _failed(self, error):
+        with self._condition:
+            self._failures += 1
+            failures = self._failures
+            failed = []
+            if failures >= MAX_FAILURES:
+                # Callers without an on_error keep waiting for a puzzle
+                failed = [on_error for _, on_error in self._waiting if on_error is not None]
+                self._waiting = deque(entry for entry in self._waiting if entry[1] is None)
+        print(f"puzzle prefetch: make() failed ({failures} in a row): {type(error).__name__}: {error}",
+              file=sys.stderr, flush=True)
+        for on_error in failed:
+            self.deliver(on_error, error)
+        # Back off so a make() that keeps failing doesn't spin; a new get()
+        # or stop() cuts the pause short
+        with self._condition:
+            if not self._stopped:
+                self._condition.wait(min(BACKOFF * 2 ** (failures - 1), MAX_BACKOFF))
+
+    def ready(self):
+        """Number of puzzles waiting to be handed out."""
+        with self._condition:
+            return len(self._ready)
+
+    def get(self, callback, on_error=None):
+        """Hand the next puzzle to `callback`; returns True if that happened right away.
+
+        If making puzzles keeps failing, on_error(error) is called instead.
+        """
+        with self._condition:
+            if not self._ready:
+                self._waiting.append((callback, on_error))
+                self._condition.notify()
+                return False
+            puzzle = self._ready.popleft()
+            # Wake the worker to make a replacement
+            self._condition.notify()
+        callback(puzzle)
+        return True
+
+    def stop(self):
+        """Stop the worker once it finishes the puzzle it is making; pending callbacks are dropped."""
+        with self._condition:
+            self._stopped = True
+            self._waiting.clear()
+            self._condition.notify()
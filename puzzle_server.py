@@ -0,0 +1,456 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import secrets
+import sys
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import sudoku_core
+from instrumentation import percentile
+from nonogram import generate_nonogram, parse_size, validate_nonogram
+from nonogram_difficulty import generate_graded_nonogram
+from puzzle_grading import LEVELS
+
+# Local HTTP/JSON puzzle service. Puzzles come out of per-(kind, size, level)
+# pools that a process pool keeps topped up, so a request is answered from
+# memory and generation never runs on the event loop. Routes:
+#
+#   GET  /nonogram?size=10x10&level=easy   a puzzle (level is optional)
+#   POST /nonogram/validate                {"id": ..., "grid": [[0, 1, ...], ...]}
+#                                          or {"row_clues", "column_clues", "grid"}
+#   GET  /sudoku?base=3                    a puzzle, 0 for blank cells
+#   POST /sudoku/validate                  {"id": ..., "grid": [[...], ...]}
+#   GET  /metrics                          pool depths and request latencies
+#   GET  /health
+#
+# Start it with `python puzzle_server.py --pool 10x10 --pool 15x15:hard --sudoku 3`.
+# Pools for puzzles that were not pre-warmed are made on the first request;
+# at most `max_pools` of them are kept, and the least recently used one is
+# dropped (and its pending jobs cancelled) to make room for a new one.
+
+# Latency samples kept per route for the metrics percentiles
+LATENCY_SAMPLES = 1000
+# Issued puzzles remembered for validation by id, oldest forgotten first
+MAX_ISSUED = 10000
+# Failed generation jobs in a row after which a pool stops refilling until
+# the next request
+MAX_FAILURES = 3
+# Pools made on demand, on top of the pre-warmed ones
+MAX_POOLS = 32
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def make_nonogram(height, width, level, seed):
+    # Runs in a worker process; returns a JSON-ready puzzle with its solution
+    rng = random.Random(seed)
+    if level:
+        grid, row_clues, column_clues, grade = generate_graded_nonogram(height, width, level, rng=rng)
+    else:
+        grid, row_clues, column_clues = generate_nonogram(height, width, unique=True, rng=rng)
+    return {"seed": seed, "height": height, "width": width, "level": level,
+            "row_clues": row_clues, "column_clues": column_clues, "solution": grid}
+
+
+def make_sudoku(base, level, seed):
+    rng = random.Random(seed)
+    if level:
+        puzzle, solution, _ = sudoku_core.generate_graded_sudoku(level, base, rng=rng)
+    else:
+        puzzle, solution = sudoku_core.generate_sudoku(base, rng=rng)
+    return {"seed": seed, "base": base, "level": level, "puzzle": puzzle, "solution": solution}
+
+
+class PuzzlePool:
+    """Keeps `depth` puzzles made by make(*args, seed) ready, generated in `executor`."""
+
+    def __init__(self, make, args, depth, executor, seeds, name=None):
+        self.make = make
+        self.args = args
+        self.depth = depth
+        self.executor = executor
+        self.seeds = seeds
+        self.name = name
+        self.jobs = set()
+        self.ready = deque()
+        self.waiting = deque()
+        self.in_flight = 0
+        self.failures = 0
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+
+    def fill(self):
+        # Start enough jobs to cover the waiting requests and refill the pool
+        loop = asyncio.get_running_loop()
+        while self.failures < MAX_FAILURES and \
+                len(self.ready) + self.in_flight < self.depth + len(self.waiting):
+            self.in_flight += 1
+            seed = f"{self.seeds.getrandbits(64):016x}"
+            future = loop.run_in_executor(self.executor, self.make, *self.args, seed)
+            self.jobs.add(future)
+            future.add_done_callback(self._done)
+
+    def close(self):
+        """Stop refilling and cancel the jobs that have not started yet."""
+        self.depth = 0
+        for future in list(self.jobs):
+            future.cancel()
+
+    def _done(self, future):
+        self.in_flight -= 1
+        self.jobs.discard(future)
+        if future.cancelled():
+            return
+        error = future.exception()
+        while self.waiting and self.waiting[0].done():
+            self.waiting.popleft()  # the client went away
+        if error is not None:
+            self.failures += 1
+            if self.failures == MAX_FAILURES and self.name:
+                print(f"warning: {self.name} pool stopped refilling after {MAX_FAILURES} failed jobs: {error}",
+                      file=sys.stderr, flush=True)
+            if self.waiting:
+                self.waiting.popleft().set_exception(error)
+        else:
+            self.failures = 0
+            self.generated += 1
+            if self.waiting:
+                self.waiting.popleft().set_result(future.result())
+            else:
+                self.ready.append(future.result())
+        self.fill()
+
+    async def get(self):
+        """The next puzzle: from the pool if one is ready, otherwise as soon as one is made."""
+        self.failures = 0
+        if self.ready:
+            self.hits += 1
+            puzzle = self.ready.popleft()
+            self.fill()
+            return puzzle
+        self.misses += 1
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiting.append(waiter)
+        self.fill()
+        return await waiter
+
+    def metrics(self):
+        return {"ready": len(self.ready), "in_flight": self.in_flight, "waiting": len(self.waiting),
+                "depth": self.depth, "hits": self.hits, "misses": self.misses, "generated": self.generated}
+
+
+class PuzzleServer:
+    """The service state: puzzle pools, issued puzzles and request metrics."""
+
+    def __init__(self, executor, depth=8, max_size=30, max_base=5, seed=None, max_pools=MAX_POOLS):
+        self.executor = executor
+        self.depth = depth
+        self.max_size = max_size
+        self.max_base = max_base
+        self.max_pools = max_pools
+        self.seeds = random.Random(seed)
+        self.pools = {}
+        # Keys of the pools made on demand, least recently used first
+        self.on_demand = OrderedDict()
+        self.issued = OrderedDict()
+        self.latencies = {}
+        self.errors = {}
+        self.started = time.time()
+        self.routes = {
+            ("GET", "/nonogram"): self.get_nonogram,
+            ("POST", "/nonogram/validate"): self.validate_nonogram,
+            ("GET", "/sudoku"): self.get_sudoku,
+            ("POST", "/sudoku/validate"): self.validate_sudoku,
+            ("GET", "/metrics"): self.metrics,
+            ("GET", "/health"): self.health,
+        }
+
+    def pool(self, kind, args, prewarm=False):
+        """The pool for one kind of puzzle, created (and started filling) on first use.
+
+        Pools made for requests rather than `prewarm` are capped at
+        `max_pools`: the least recently used idle one is closed to make room,
+        and HTTPError 503 is raised if every one of them has requests waiting.
+        """
+        key = (kind,) + args
+        pool = self.pools.get(key)
+        if pool is not None:
+            if key in self.on_demand:
+                self.on_demand.move_to_end(key)
+            return pool
+        if not prewarm:
+            if len(self.on_demand) >= self.max_pools:
+                idle = next((old for old in self.on_demand if not self.pools[old].waiting), None)
+                if idle is None:
+                    raise HTTPError(503, "too many kinds of puzzle are being generated, try again later")
+                del self.on_demand[idle]
+                self.pools.pop(idle).close()
+            self.on_demand[key] = None
+        make = make_nonogram if kind == "nonogram" else make_sudoku
+        name = f"{kind} {args[0]}x{args[1]}" if kind == "nonogram" else f"{kind} base {args[0]}"
+        if args[-1]:
+            name += f" {args[-1]}"
+        pool = self.pools[key] = PuzzlePool(make, args, self.depth, self.executor, self.seeds, name)
+        pool.fill()
+        return pool
+
+    def _issue(self, kind, puzzle):
+        puzzle_id = secrets.token_hex(8)
+        self.issued[puzzle_id] = (kind, puzzle)
+        if len(self.issued) > MAX_ISSUED:
+            self.issued.popitem(last=False)
+        return puzzle_id
+
+    def _issued(self, kind, body):
+        entry = self.issued.get(body.get("id"))
+        if entry is None or entry[0] != kind:
+            raise HTTPError(404, f"unknown {kind} id {body.get('id')!r}")
+        return entry[1]
+
+    @staticmethod
+    def _level(query):
+        level = query.get("level", [None])[0]
+        if level is not None and level not in LEVELS:
+            raise HTTPError(400, f"level must be one of {', '.join(LEVELS)}")
+        return level
+
+    async def get_nonogram(self, query, body):
+        try:
+            height, width = parse_size(query.get("size", ["10x10"])[0])
+        except argparse.ArgumentTypeError as exc:
+            raise HTTPError(400, str(exc))
+        if height > self.max_size or width > self.max_size:
+            raise HTTPError(400, f"sizes go from 1 to {self.max_size}")
+        puzzle = await self.pool("nonogram", (height, width, self._level(query))).get()
+        public = {key: value for key, value in puzzle.items() if key != "solution"}
+        public["id"] = self._issue("nonogram", puzzle)
+        return public
+
+    async def validate_nonogram(self, query, body):
+        if "id" in body:
+            puzzle = self._issued("nonogram", body)
+            row_clues, column_clues = puzzle["row_clues"], puzzle["column_clues"]
+        else:
+            row_clues, column_clues = body.get("row_clues"), body.get("column_clues")
+        grid = body.get("grid")
+        if not isinstance(grid, list) or not grid or not isinstance(row_clues, list) or \
+                not isinstance(column_clues, list):
+            raise HTTPError(400, "need a grid and either an id or row_clues and column_clues")
+        if len(grid) != len(row_clues) or any(not isinstance(row, list) or len(row) != len(column_clues)
+                                              for row in grid):
+            return {"valid": False, "reason": "grid size does not match the clues"}
+        return {"valid": validate_nonogram(grid, row_clues, column_clues)}
+
+    async def get_sudoku(self, query, body):
+        try:
+            base = int(query.get("base", ["3"])[0])
+        except ValueError:
+            raise HTTPError(400, "base must be a number")
+        if not 2 <= base <= self.max_base:
+            raise HTTPError(400, f"base goes from 2 to {self.max_base}")
+        puzzle = await self.pool("sudoku", (base, self._level(query))).get()
+        public = {key: value for key, value in puzzle.items() if key != "solution"}
+        public["id"] = self._issue("sudoku", puzzle)
+        return public
+
+    async def validate_sudoku(self, query, body):
+        puzzle = self._issued("sudoku", body)
+        grid = body.get("grid")
+        if not isinstance(grid, list):
+            raise HTTPError(400, "need an id and a grid")
+        # Puzzles have a single solution, so the grid is right exactly when it is that solution
+        return {"valid": grid == puzzle["solution"]}
+
+    async def metrics(self, query, body):
+        pools = []
+        for key, pool in self.pools.items():
+            entry = {"kind": key[0], "level": key[-1]}
+            if key[0] == "nonogram":
+                entry["size"] = f"{key[1]}x{key[2]}"
+            else:
+                entry["base"] = key[1]
+            entry.update(pool.metrics())
+            pools.append(entry)
+        requests = {}
+        for route, samples in self.latencies.items():
+            ordered = sorted(samples)
+            requests[route] = {"count": samples.count_total, "errors": self.errors.get(route, 0),
+                               "p50_ms": percentile(ordered, 0.5) * 1000,
+                               "p99_ms": percentile(ordered, 0.99) * 1000}
+        return {"uptime": time.time() - self.started, "issued": len(self.issued),
+                "pools": pools, "requests": requests}
+
+    async def health(self, query, body):
+        return {"ok": True}
+
+    def _record(self, route, elapsed, failed):
+        samples = self.latencies.get(route)
+        if samples is None:
+            samples = self.latencies[route] = _Samples(maxlen=LATENCY_SAMPLES)
+        samples.append(elapsed)
+        samples.count_total += 1
+        if failed:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+    async def handle(self, method, target, body):
+        """Answer one request; returns (status, JSON-ready response)."""
+        start = time.perf_counter()
+        url = urlsplit(target)
+        handler = self.routes.get((method, url.path))
+        status = 200
+        try:
+            if handler is None:
+                if any(path == url.path for _, path in self.routes):
+                    raise HTTPError(405, f"{method} is not allowed on {url.path}")
+                raise HTTPError(404, f"no route {url.path}")
+            try:
+                data = json.loads(body) if body else {}
+            except ValueError:
+                raise HTTPError(400, "body is not valid JSON")
+            if not isinstance(data, dict):
+                raise HTTPError(400, "body must be a JSON object")
+            response = await handler(parse_qs(url.query), data)
+        except HTTPError as exc:
+            status, response = exc.status, {"error": str(exc)}
+        except RuntimeError as exc:
+            # A generator gave up, e.g. on a level it could not reach
+            status, response = 503, {"error": str(exc)}
+        except Exception as exc:
+            status, response = 500, {"error": f"{type(exc).__name__}: {exc}"}
+        if handler is not None:
+            self._record(url.path, time.perf_counter() - start, status != 200)
+        return status, response
+
+
+class _Samples(deque):
+    # Recent latencies plus the number of requests ever seen
+    count_total = 0
+
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+async def serve_connection(server, reader, writer, max_body=1 << 22):
+    """Speak just enough HTTP/1.1 (keep-alive, Content-Length bodies) to serve JSON."""
+    try:
+        while True:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                return
+            lines = head.decode("latin-1").split("\r\n")
+            try:
+                method, target, version = lines[0].split(" ")
+            except ValueError:
+                return
+            headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(":")
+                if name:
+                    headers[name.strip().lower()] = value.strip()
+            # Without a usable length the body can't be told apart from the
+            # next request, so these errors close the connection
+            length = headers.get("content-length", "0" if method != "POST" else None)
+            if length is None or not length.isdecimal():
+                status, response = 400, {"error": "need a Content-Length header with the body size in bytes"}
+                body = None
+            elif int(length) > max_body:
+                status, response = 413, {"error": "request body too large"}
+                body = None
+            else:
+                length = int(length)
+                body = await reader.readexactly(length) if length else b""
+                status, response = await server.handle(method, target, body)
+            payload = json.dumps(response, separators=(",", ":")).encode("utf-8")
+            keep_alive = body is not None and headers.get("connection", "").lower() != "close" and \
+                version == "HTTP/1.1"
+            writer.write(f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                         f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+                         f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1")
+                         + payload)
+            await writer.drain()
+            if not keep_alive:
+                return
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+def _pool_spec(text):
+    # "10x10" or "15x15:hard"
+    size, _, level = text.partition(":")
+    height, width = parse_size(size)
+    if level and level not in LEVELS:
+        raise argparse.ArgumentTypeError(f"level must be one of {', '.join(LEVELS)}")
+    return height, width, level or None
+
+
+def _sudoku_spec(text):
+    # "3" or "3:hard"
+    base, _, level = text.partition(":")
+    if not base.isdecimal() or (level and level not in LEVELS):
+        raise argparse.ArgumentTypeError(f"sudoku pool must look like BASE or BASE:LEVEL, got {text!r}")
+    return int(base), level or None
+
+
+async def run(args):
+    executor = ProcessPoolExecutor(max_workers=args.workers)
+    server = PuzzleServer(executor, args.depth, args.max_size, args.max_base, args.seed, args.max_pools)
+    # Pre-warm the configured pools before taking requests
+    for height, width, level in args.pool:
+        server.pool("nonogram", (height, width, level), prewarm=True)
+    for base, level in args.sudoku:
+        server.pool("sudoku", (base, level), prewarm=True)
+    listener = await asyncio.start_server(lambda reader, writer: serve_connection(server, reader, writer),
+                                          args.host, args.port)
+    print(f"Serving puzzles on http://{args.host}:{args.port}", flush=True)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="puzzle_server", description="Serve nonogram and Sudoku puzzles over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on (default 8765)")
+    parser.add_argument("--pool", type=_pool_spec, action="append", default=[],
+                        help="nonogram pool to fill at start, as HxW or HxW:LEVEL (repeatable)")
+    parser.add_argument("--sudoku", type=_sudoku_spec, action="append", default=[],
+                        help="Sudoku pool to fill at start, as BASE or BASE:LEVEL (repeatable)")
+    parser.add_argument("--depth", type=int, default=8, help="puzzles kept ready per pool (default 8)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="generator processes")
+    parser.add_argument("--max-size", type=int, default=30, help="largest nonogram side served (default 30)")
+    parser.add_argument("--max-base", type=int, default=5, help="largest Sudoku box size served (default 5)")
+    parser.add_argument("--max-pools", type=int, default=MAX_POOLS,
+                        help=f"pools kept for puzzles that were not pre-warmed (default {MAX_POOLS})")
+    parser.add_argument("--seed", help="seed for the puzzle seeds, for reproducible runs")
+    args = parser.parse_args(argv)
+    # Pre-warmed pools get the same bounds as requests
+    for height, width, _ in args.pool:
+        if height > args.max_size or width > args.max_size:
+            parser.error(f"pool {height}x{width} is larger than --max-size {args.max_size}")
+    for base, _ in args.sudoku:
+        if not 2 <= base <= args.max_base:
+            parser.error(f"Sudoku base {base} is outside 2 to --max-base {args.max_base}")
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
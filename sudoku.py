@@ -1,83 +1,125 @@
+import sys
+
 from kivy.app import App
+from kivy.clock import Clock
 from kivy.uix.gridlayout import GridLayout
 from kivy.uix.button import Button
-from kivy.uix.textinput import TextInput
 from kivy.uix.popup import Popup
 from kivy.uix.label import Label
-from random import sample
-from copy import deepcopy
+
+import sudoku_core
+from puzzle_prefetch import PuzzlePrefetcher
+
+# Puzzles kept generated ahead of the "New Puzzle" button
+PREFETCH_DEPTH = 2
 
 
 class SudokuGrid(GridLayout):
-    def __init__(self, **kwargs):
+    def __init__(self, base=3, **kwargs):
         super(SudokuGrid, self).__init__(**kwargs)
-        self.cols = 9
-        self.rows = 9
+        self.base = base
+        self.side = base * base  # 9 for a regular Sudoku, 16 or 25 for the large variants
+        self.cols = self.side
+        self.rows = self.side
         self.padding = [10, 10, 10, 10]  # Padding around the grid
         self.spacing = [5, 5]  # Slightly larger spacing for better visibility
         self.puzzle, self.solution = self.generate_sudoku()
         self.inputs = []
+        self.tracker = None
+        self._loading = False
 
         self.create_grid()
+        # Large boards take a second or more to generate, so keep the next
+        # puzzles ready in the background
+        self.prefetcher = PuzzlePrefetcher(self.generate_sudoku, PREFETCH_DEPTH, deliver=self.deliver_puzzle)
 
     def create_grid(self):
-        """Create and initialize the Sudoku grid."""
-        self.clear_widgets()
-
-        # Create grid with increased size, scaling with window width
-        for i in range(9):
-            for j in range(9):
+        """Create and initialize the Sudoku grid, reusing cell widgets from earlier puzzles."""
+        # Imported here because loading TextInput creates the Kivy window, which
+        # importing this module should not do
+        from kivy.uix.textinput import TextInput
+
+        side = self.side
+        # Only create or remove the difference when the number of cells changes
+        while len(self.inputs) < side * side:
+            # Sizes are for a 9x9 grid and shrink with larger boards
+            ti = TextInput(font_size=360 // side,  # Increased font size
+                           halign='center', padding_y=(180 // side, 180 // side),  # Increased padding for better visual
+                           foreground_color=(0, 0, 0, 1), multiline=False,
+                           size_hint=(None, None), height=900 // side, width=self.width / (side + 1))  # Scaling
+            ti.bind(text=lambda ti, text, index=len(self.inputs): self.on_cell_text(index, text))
+            self.inputs.append(ti)
+            self.add_widget(ti)
+        while len(self.inputs) > side * side:
+            self.remove_widget(self.inputs.pop())
+
+        # Fill the cells without reporting each one, then count the clues once
+        self._loading = True
+        for i in range(side):
+            for j in range(side):
+                ti = self.inputs[i * side + j]
+                ti.focus = False
                 if self.puzzle[i][j] != 0:
-                    ti = TextInput(text=str(self.puzzle[i][j]), readonly=True,
-                                   font_size=40,  # Increased font size
-                                   halign='center', padding_y=(20, 20),  # Increased padding for better visual
-                                   foreground_color=(0, 0, 0, 1),
-                                   background_color=(0.8, 0.8, 0.8, 1),
-                                   multiline=False, size_hint=(None, None), height=100, width=self.width * 0.1)  # Scaling
+                    ti.text = str(self.puzzle[i][j])
+                    ti.readonly = True
+                    ti.background_color = (0.8, 0.8, 0.8, 1)
                     ti.cursor = (0, 0)
                     ti.disabled = True
                 else:
-                    ti = TextInput(font_size=40,
-                                   halign='center', padding_y=(20, 20),
-                                   foreground_color=(0, 0, 0, 1), multiline=False,
-                                   size_hint=(None, None), height=100, width=self.width * 0.1)  # Scaling
-                    ti.focus = False
-
-                self.inputs.append(ti)
-                self.add_widget(ti)
+                    ti.disabled = False
+                    ti.readonly = False
+                    ti.background_color = (1, 1, 1, 1)
+                    ti.text = ""
+        self._loading = False
+        self.tracker = sudoku_core.ConflictTracker(self.base)
+        for i in range(side):
+            for j in range(side):
+                self.tracker.set_digit(i, j, self.puzzle[i][j])
+
+    def on_cell_text(self, index, text):
+        """Update the conflict counts for one edited cell and recolour the cells it affects."""
+        if self._loading:
+            return
+        row, col = divmod(index, self.side)
+        digit = int(text) if text.isdigit() and 1 <= int(text) <= self.side else 0
+        for i, j in self.tracker.set_digit(row, col, digit):
+            self.paint_cell(i, j)
+        if self.tracker.is_solved():
+            self.show_popup("Solved!")
+
+    def paint_cell(self, row, col):
+        """Colour a cell by whether it is a clue and whether it clashes with another cell."""
+        ti = self.inputs[row * self.side + col]
+        conflict = self.tracker.is_conflict(row, col)
+        if self.puzzle[row][col] != 0:
+            ti.background_color = (0.9, 0.55, 0.55, 1) if conflict else (0.8, 0.8, 0.8, 1)
+        else:
+            ti.background_color = (1, 0.6, 0.6, 1) if conflict else (1, 1, 1, 1)
 
     def on_size(self, *args):
         """Handle resizing for the grid elements."""
         for ti in self.inputs:
-            ti.width = self.width * 0.1
+            ti.width = self.width / (self.side + 1)
 
     def generate_sudoku(self):
-        """Generates a random Sudoku puzzle and its solution"""
-        base = 3
-        side = base * base
+        """Generates a random Sudoku puzzle with a unique solution, and that solution"""
+        return sudoku_core.generate_sudoku(base=self.base)
 
-        def pattern(r, c): return (base * (r % base) + r // base + c) % side
-        def shuffle(s): return sample(s, len(s))
-        rBase = range(base)
-        rows = [g * base + r for g in shuffle(rBase) for r in shuffle(rBase)]
-        cols = [g * base + c for g in shuffle(rBase) for c in shuffle(rBase)]
-        nums = shuffle(range(1, base * base + 1))
-
-        solution = [[nums[pattern(r, c)] for c in cols] for r in rows]
-
-        puzzle = deepcopy(solution)
-        for i in sample(range(side * side), side * side // 2):
-            puzzle[i // side][i % side] = 0
-
-        return puzzle, solution
+    def deliver_puzzle(self, callback, puzzle):
+        """Hand a puzzle made on the prefetch thread back to the UI thread."""
+        Clock.schedule_once(lambda dt: callback(puzzle))
 
     def update_grid(self):
-        """Updates the grid with a new puzzle and clears all cells."""
-        self.puzzle, self.solution = self.generate_sudoku()
+        """Updates the grid with a new puzzle, shown as soon as one is ready."""
+        self.prefetcher.get(self.show_puzzle, self.show_generation_error)
 
-        self.clear_widgets()
-        self.inputs.clear()
+    def show_generation_error(self, error):
+        """Tell the player that puzzles could not be generated."""
+        self.show_popup(f"Could not generate a puzzle:\n{error}")
 
+    def show_puzzle(self, puzzle):
+        """Show a (puzzle, solution) pair and clear all cells."""
+        self.puzzle, self.solution = puzzle
         self.create_grid()
 
     def check_solution(self):
@@ -85,9 +127,9 @@ class SudokuGrid(GridLayout):
         correct_count = 0
         total_filled = 0
 
-        for i in range(9):
-            for j in range(9):
-                input_value = self.inputs[i * 9 + j].text
+        for i in range(self.side):
+            for j in range(self.side):
+                input_value = self.inputs[i * self.side + j].text
 
                 if input_value and input_value.isdigit():
                     total_filled += 1
@@ -130,10 +172,14 @@ class SudokuGrid(GridLayout):
 
 
 class SudokuApp(App):
+    def __init__(self, base=3, **kwargs):
+        super(SudokuApp, self).__init__(**kwargs)
+        self.base = base
+
     def build(self):
         layout = GridLayout(cols=1, padding=[10, 10, 10, 10], spacing=[10, 10])
 
-        sudoku_grid = SudokuGrid(size_hint=(1, None))
+        sudoku_grid = SudokuGrid(base=self.base, size_hint=(1, None))
         sudoku_grid.bind(minimum_height=sudoku_grid.setter('height'))
         layout.add_widget(sudoku_grid)
 
@@ -145,8 +191,13 @@ class SudokuApp(App):
         new_puzzle_button.bind(on_press=lambda x: sudoku_grid.show_confirm_new_puzzle())
         layout.add_widget(new_puzzle_button)
 
+        self.sudoku_grid = sudoku_grid
         return layout
 
+    def on_stop(self):
+        self.sudoku_grid.prefetcher.stop()
+
 
 if __name__ == "__main__":
-    SudokuApp().run()
+    # Box size comes after "--" so Kivy leaves it alone: python sudoku.py -- 4 plays 16x16
+    SudokuApp(base=int(sys.argv[1]) if len(sys.argv) > 1 else 3).run()
@@ -0,0 +1,578 @@
+import random
+from collections import namedtuple
+
+import instrumentation
+from puzzle_grading import LEVELS, PROBE_WEIGHT, distance, probe_level
+
+# Headless Sudoku logic used by sudoku.py. Grids are lists of rows holding
+# digits 1..side, with 0 for a blank cell; side = base * base.
+
+
+def solution_grid(base=3, rng=random):
+    """Build a random complete grid by shuffling a valid base pattern."""
+    side = base * base
+
+    def pattern(r, c): return (base * (r % base) + r // base + c) % side
+    def shuffle(s): return rng.sample(s, len(s))
+    r_base = range(base)
+    rows = [g * base + r for g in shuffle(r_base) for r in shuffle(r_base)]
+    cols = [g * base + c for g in shuffle(r_base) for c in shuffle(r_base)]
+    nums = shuffle(range(1, side + 1))
+    return [[nums[pattern(r, c)] for c in cols] for r in rows]
+
+
+class SearchBudgetExceeded(Exception):
+    pass
+
+
+def _bitmask_search(puzzle, base, limit, max_nodes=None):
+    # Backtracking over per-row/column/box digit bitmasks, always filling the
+    # blank cell with the fewest candidates next. Returns up to `limit`
+    # solutions; raises SearchBudgetExceeded after `max_nodes` search steps.
+    side = base * base
+    full = (1 << side) - 1
+    rows = [0] * side
+    cols = [0] * side
+    boxes = [0] * side
+    blanks = []
+    grid = [row[:] for row in puzzle]
+    for r in range(side):
+        for c in range(side):
+            b = (r // base) * base + c // base
+            value = grid[r][c]
+            if not value:
+                blanks.append((r, c, b))
+                continue
+            bit = 1 << (value - 1)
+            if (rows[r] | cols[c] | boxes[b]) & bit:
+                return []
+            rows[r] |= bit
+            cols[c] |= bit
+            boxes[b] |= bit
+
+    found = []
+    nodes = [max_nodes]
+
+    def search(n):
+        # blanks[:n] are the cells still to fill
+        if nodes[0] is not None:
+            nodes[0] -= 1
+            if nodes[0] < 0:
+                raise SearchBudgetExceeded()
+        if n == 0:
+            found.append([row[:] for row in grid])
+            return len(found) >= limit
+        best = 0
+        best_count = side + 1
+        best_cand = 0
+        for k in range(n):
+            r, c, b = blanks[k]
+            cand = full & ~(rows[r] | cols[c] | boxes[b])
+            count = bin(cand).count("1")
+            if count < best_count:
+                best, best_count, best_cand = k, count, cand
+                if count <= 1:
+                    break
+        if not best_count:
+            return False
+        blanks[best], blanks[n - 1] = blanks[n - 1], blanks[best]
+        r, c, b = blanks[n - 1]
+        cand = best_cand
+        while cand:
+            bit = cand & -cand
+            cand ^= bit
+            rows[r] |= bit
+            cols[c] |= bit
+            boxes[b] |= bit
+            grid[r][c] = bit.bit_length()
+            done = search(n - 1)
+            rows[r] ^= bit
+            cols[c] ^= bit
+            boxes[b] ^= bit
+            if done:
+                return True
+        grid[r][c] = 0
+        return False
+
+    search(len(blanks))
+    return found
+
+
+# Exact cover rows by base: candidate (row, col, digit) -> the four
+# constraints it satisfies (cell filled, digit in row, in column, in box)
+_cover_rows = {}
+
+
+def _cover_matrix(base):
+    if base not in _cover_rows:
+        side = base * base
+        n = side * side
+        rows = {}
+        for r in range(side):
+            for c in range(side):
+                b = (r // base) * base + c // base
+                for d in range(side):
+                    rows[(r, c, d)] = (r * side + c, n + r * side + d, 2 * n + c * side + d, 3 * n + b * side + d)
+        _cover_rows[base] = rows
+    return _cover_rows[base]
+
+
+def _cover(columns, rows, candidate):
+    # Take `candidate` into the solution: drop the constraints it satisfies
+    # and every other candidate clashing with it. Returns what was removed.
+    removed = []
+    for j in rows[candidate]:
+        for other in columns[j]:
+            for k in rows[other]:
+                if k != j:
+                    columns[k].remove(other)
+        removed.append(columns.pop(j))
+    return removed
+
+
+def _uncover(columns, rows, candidate, removed):
+    for j in reversed(rows[candidate]):
+        columns[j] = removed.pop()
+        for other in columns[j]:
+            for k in rows[other]:
+                if k != j:
+                    columns[k].add(other)
+
+
+def _exact_cover_search(puzzle, base, limit, max_nodes=None):
+    # Knuth's Algorithm X with dancing links, where the links are sets: each
+    # constraint keeps the set of candidates still able to satisfy it, and
+    # the search always branches on the constraint with the fewest. Besides
+    # the single-candidate cells the bitmask search finds, this also spots a
+    # digit with a single place left in a row, column or box.
+    side = base * base
+    n = side * side
+    full = (1 << side) - 1
+    rows = _cover_matrix(base)
+    row_used = [0] * side
+    col_used = [0] * side
+    box_used = [0] * side
+    blanks = []
+    for r in range(side):
+        for c in range(side):
+            b = (r // base) * base + c // base
+            value = puzzle[r][c]
+            if not value:
+                blanks.append((r, c, b))
+                continue
+            bit = 1 << (value - 1)
+            if (row_used[r] | col_used[c] | box_used[b]) & bit:
+                return []
+            row_used[r] |= bit
+            col_used[c] |= bit
+            box_used[b] |= bit
+
+    # Start from the matrix with the clues already covered: only the
+    # constraints the clues leave open, holding the candidates the clues allow
+    columns = {}
+    for r in range(side):
+        for d in range(side):
+            if not (row_used[r] >> d) & 1:
+                columns[n + r * side + d] = set()
+            if not (col_used[r] >> d) & 1:
+                columns[2 * n + r * side + d] = set()
+            if not (box_used[r] >> d) & 1:
+                columns[3 * n + r * side + d] = set()
+    for r, c, b in blanks:
+        columns[r * side + c] = set()
+        cand = full & ~(row_used[r] | col_used[c] | box_used[b])
+        while cand:
+            bit = cand & -cand
+            cand ^= bit
+            candidate = (r, c, bit.bit_length() - 1)
+            for j in rows[candidate]:
+                columns[j].add(candidate)
+
+    grid = [row[:] for row in puzzle]
+    found = []
+    nodes = [max_nodes]
+
+    def search():
+        if nodes[0] is not None:
+            nodes[0] -= 1
+            if nodes[0] < 0:
+                raise SearchBudgetExceeded()
+        if not columns:
+            found.append([row[:] for row in grid])
+            return len(found) >= limit
+        best = None
+        best_size = side + 1
+        for j, candidates in columns.items():
+            if len(candidates) < best_size:
+                best, best_size = candidates, len(candidates)
+                if best_size <= 1:
+                    break
+        for candidate in list(best):
+            r, c, d = candidate
+            grid[r][c] = d + 1
+            removed = _cover(columns, rows, candidate)
+            done = search()
+            _uncover(columns, rows, candidate, removed)
+            if done:
+                return True
+        return False
+
+    search()
+    return found
+
+
+def _search(puzzle, base, limit, max_nodes=None):
+    # Plain 9x9 boards are fastest with the bitmask search; larger ones need
+    # exact cover's stronger branching to finish in interactive time
+    if base <= 3:
+        return _bitmask_search(puzzle, base, limit, max_nodes)
+    return _exact_cover_search(puzzle, base, limit, max_nodes)
+
+
+@instrumentation.timed("sudoku_count_solutions")
+def count_solutions(puzzle, base=3, limit=2, max_nodes=None):
+    """Count the solutions of a puzzle, stopping once `limit` have been found.
+
+    Returns (count, solutions), so `count_solutions(puzzle)[0] == 1` means the
+    puzzle is unique. If `max_nodes` is given and the search needs more steps
+    than that, count is None.
+    """
+    if instrumentation.enabled:
+        instrumentation.count("sudoku_searches")
+    try:
+        solutions = _search(puzzle, base, limit, max_nodes)
+    except SearchBudgetExceeded:
+        if instrumentation.enabled:
+            instrumentation.count("sudoku_budget_exceeded")
+        return None, []
+    return len(solutions), solutions
+
+
+def solve_sudoku(puzzle, base=3):
+    """Return one solution of the puzzle, or None if it has none."""
+    solutions = _search(puzzle, base, 1)
+    return solutions[0] if solutions else None
+
+
+def _only_candidate(puzzle, base, row, col):
+    # True if every other digit already appears in the cell's row, column or box
+    side = base * base
+    seen = set(puzzle[row])
+    seen.update(puzzle[r][col] for r in range(side))
+    top = row - row % base
+    left = col - col % base
+    for r in range(top, top + base):
+        seen.update(puzzle[r][left:left + base])
+    seen.discard(0)
+    return len(seen) == side - 1
+
+
+@instrumentation.timed("dig_puzzle")
+def dig_puzzle(solution, base=3, holes=None, max_nodes=None, rng=random):
+    """Blank cells of a complete grid while the puzzle stays uniquely solvable.
+
+    Cells are taken out in random order, in batches that double while the
+    puzzle stays unique and halve when it does not; a batch is only kept if
+    the puzzle still has exactly one solution, and a single clue that cannot
+    be removed is left in place. A cell whose digit is the only candidate
+    left needs no check. Uniqueness checks that take more than `max_nodes`
+    search steps (default 2 * side * side) count as failed, which keeps large
+    boards fast without ever giving up uniqueness. Stops after `holes` cells
+    are blank (default: as many as possible).
+    """
+    side = base * base
+    puzzle = [row[:] for row in solution]
+    if holes is None:
+        holes = side * side
+    if max_nodes is None:
+        max_nodes = 2 * side * side
+    order = rng.sample(range(side * side), side * side)
+    removed = 0
+    pos = 0
+    step = holes
+    while removed < holes and pos < len(order):
+        batch = order[pos:pos + min(step, holes - removed)]
+        for i in batch:
+            puzzle[i // side][i % side] = 0
+        if len(batch) == 1:
+            row, col = divmod(batch[0], side)
+            unique = _only_candidate(puzzle, base, row, col) or \
+                count_solutions(puzzle, base, 2, max_nodes)[0] == 1
+        else:
+            unique = count_solutions(puzzle, base, 2, max_nodes)[0] == 1
+        if unique:
+            removed += len(batch)
+            pos += len(batch)
+            step *= 2
+            continue
+        for i in batch:
+            puzzle[i // side][i % side] = solution[i // side][i % side]
+        if instrumentation.enabled:
+            instrumentation.count("sudoku_rejected_batches")
+        if len(batch) == 1:
+            pos += 1
+        else:
+            step = len(batch) // 2
+    return puzzle
+
+
+@instrumentation.timed("generate_sudoku")
+def generate_sudoku(base=3, holes=None, rng=random):
+    """Generate a uniquely solvable puzzle; returns (puzzle, solution).
+
+    `holes` is the number of blank cells to aim for, side * side // 2 by default.
+    """
+    side = base * base
+    if holes is None:
+        holes = side * side // 2
+    solution = solution_grid(base, rng)
+    return dig_puzzle(solution, base, holes, rng=rng), solution
+
+
+# Difficulty levels (see puzzle_grading for hard and expert, where a probe
+# tries one digit of a two-candidate cell and follows singles to a
+# contradiction):
+#   easy    hidden singles alone (a digit with one place left in a row, column or box)
+#   medium  also needs naked singles (a cell with one candidate left)
+
+# techniques is a tuple of the deductions used: "hidden single", "naked single", "probe", "guess"
+Grade = namedtuple("Grade", "level score rounds probes techniques")
+
+
+def _fill_singles(grid, base, techniques=None):
+    # Fill `grid` in place with rounds of singles: every round places all
+    # hidden singles, or all naked singles if there are none. Returns
+    # (hidden rounds, naked rounds, blank cells left as (row, col, candidates)),
+    # or None on a contradiction.
+    side = base * base
+    full = (1 << side) - 1
+    hidden_rounds = 0
+    naked_rounds = 0
+    while True:
+        rows = [0] * side
+        cols = [0] * side
+        boxes = [0] * side
+        for r in range(side):
+            for c in range(side):
+                if grid[r][c]:
+                    bit = 1 << (grid[r][c] - 1)
+                    b = (r // base) * base + c // base
+                    if (rows[r] | cols[c] | boxes[b]) & bit:
+                        return None
+                    rows[r] |= bit
+                    cols[c] |= bit
+                    boxes[b] |= bit
+        units = [[] for _ in range(3 * side)]
+        blanks = []
+        for r in range(side):
+            for c in range(side):
+                if not grid[r][c]:
+                    b = (r // base) * base + c // base
+                    cand = full & ~(rows[r] | cols[c] | boxes[b])
+                    if not cand:
+                        return None
+                    cell = (r, c, cand)
+                    blanks.append(cell)
+                    units[r].append(cell)
+                    units[side + c].append(cell)
+                    units[2 * side + b].append(cell)
+
+        placements = {}
+        for unit in units:
+            once = 0
+            twice = 0
+            for _, _, cand in unit:
+                twice |= once & cand
+                once |= cand
+            singles = once & ~twice
+            while singles:
+                bit = singles & -singles
+                singles ^= bit
+                for r, c, cand in unit:
+                    if cand & bit:
+                        placements[(r, c)] = bit.bit_length()
+                        break
+        if placements:
+            hidden_rounds += 1
+            technique = "hidden single"
+        else:
+            for r, c, cand in blanks:
+                if not cand & (cand - 1):
+                    placements[(r, c)] = cand.bit_length()
+            if not placements:
+                return hidden_rounds, naked_rounds, blanks
+            naked_rounds += 1
+            technique = "naked single"
+        if techniques is not None and technique not in techniques:
+            techniques.append(technique)
+        for (r, c), digit in placements.items():
+            grid[r][c] = digit
+
+
+def _probe(grid, base, blanks):
+    # Find a two-candidate cell where one digit leads singles into a
+    # contradiction; returns (row, col, the other digit) or None
+    for r, c, cand in blanks:
+        if bin(cand).count("1") != 2:
+            continue
+        low = cand & -cand
+        for bit, other in ((low, cand ^ low), (cand ^ low, low)):
+            trial = [row[:] for row in grid]
+            trial[r][c] = bit.bit_length()
+            if _fill_singles(trial, base) is None:
+                return r, c, other.bit_length()
+    return None
+
+
+@instrumentation.timed("grade_sudoku")
+def grade_sudoku(puzzle, base=3):
+    """Grade a puzzle by replaying how a logic solver gets through it.
+
+    The solver places singles in rounds and, when they get stuck, probes a
+    two-candidate cell for a contradiction and carries on. Returns a Grade
+    with the level, a score (hidden single rounds, twice the naked single
+    rounds, PROBE_WEIGHT per probe and three per cell left if it has to
+    guess), the number of rounds and probes and the techniques used, or None
+    if the puzzle has no solution. Unless "guess" is among the techniques,
+    the puzzle is proven to have a single solution.
+    """
+    grid = [row[:] for row in puzzle]
+    techniques = []
+    hidden_rounds = 0
+    naked_rounds = 0
+    probes = 0
+    while True:
+        result = _fill_singles(grid, base, techniques)
+        if result is None:
+            return None
+        hidden_rounds += result[0]
+        naked_rounds += result[1]
+        blanks = result[2]
+        if not blanks:
+            break
+        forced = _probe(grid, base, blanks)
+        if forced is None:
+            if solve_sudoku(grid, base) is None:
+                return None
+            techniques.append("guess")
+            break
+        r, c, digit = forced
+        grid[r][c] = digit
+        probes += 1
+        if "probe" not in techniques:
+            techniques.append("probe")
+
+    score = hidden_rounds + 2 * naked_rounds + PROBE_WEIGHT * probes
+    if "guess" in techniques:
+        score += 3 * len(blanks)
+    level = probe_level(probes, "guess" in techniques)
+    if level is None:
+        level = "medium" if naked_rounds else "easy"
+    return Grade(level, score, hidden_rounds + naked_rounds, probes, tuple(techniques))
+
+
+@instrumentation.timed("generate_graded_sudoku")
+def generate_graded_sudoku(level, base=3, max_steps=1000, max_nodes=None, rng=random):
+    """Generate a uniquely solvable puzzle at the requested difficulty level.
+
+    Starts from generate_sudoku and walks towards `level` one cell at a time:
+    blanking a clue to make it harder (kept only while the puzzle stays
+    unique) or giving back a solution digit to make it easier. A change is
+    kept if it does not move away from the target, and a cell whose change
+    was turned down is not tried again until the puzzle gets a clue back. If
+    no cell is left to try, the walk starts over from a new puzzle. Returns
+    (puzzle, solution, grade).
+    """
+    side = base * base
+    if max_nodes is None:
+        max_nodes = 2 * side * side
+    target = LEVELS.index(level)
+    puzzle = None
+    for _ in range(max_steps):
+        if puzzle is None:
+            puzzle, solution = generate_sudoku(base, rng=rng)
+            grade = grade_sudoku(puzzle, base)
+            rejected = set()
+        if grade.level == level:
+            return puzzle, solution, grade
+        harder = LEVELS.index(grade.level) < target
+        cells = [(r, c) for r in range(side) for c in range(side)
+                 if bool(puzzle[r][c]) == harder and (r, c) not in rejected]
+        if not cells:
+            puzzle = None
+            continue
+        r, c = rng.choice(cells)
+        puzzle[r][c] = 0 if harder else solution[r][c]
+        new_grade = grade_sudoku(puzzle, base)
+        if new_grade is not None and "guess" in new_grade.techniques and \
+                count_solutions(puzzle, base, 2, max_nodes)[0] != 1:
+            new_grade = None
+        if new_grade is not None and distance(new_grade, target) <= distance(grade, target):
+            grade = new_grade
+            if not harder:
+                rejected.clear()
+            continue
+        puzzle[r][c] = solution[r][c] if harder else 0
+        rejected.add((r, c))
+        if instrumentation.enabled:
+            instrumentation.count("rejected_changes")
+    if puzzle is not None and grade.level == level:
+        return puzzle, solution, grade
+    raise RuntimeError(f"Could not reach {level} difficulty for a {side}x{side} Sudoku in {max_steps} steps")
+
+
+class ConflictTracker:
+    """Digits entered so far, with the row, column and box clashes between them.
+
+    Every row, column and box keeps, per digit, the set of cells holding it,
+    so an edit only touches the cells sharing the old or new digit with the
+    edited cell and never needs the solution.
+    """
+
+    def __init__(self, base=3):
+        self.base = base
+        self.side = base * base
+        self.cells = [[0] * self.side for _ in range(self.side)]
+        # units[u][digit] holds the cells with that digit; rows come first,
+        # then columns, then boxes
+        self.units = [[set() for _ in range(self.side + 1)] for _ in range(3 * self.side)]
+        self.conflicting = set()
+        self.filled = 0
+
+    def _units(self, row, col):
+        box = (row // self.base) * self.base + col // self.base
+        return self.units[row], self.units[self.side + col], self.units[2 * self.side + box]
+
+    def _clashes(self, row, col):
+        digit = self.cells[row][col]
+        return bool(digit) and any(len(unit[digit]) > 1 for unit in self._units(row, col))
+
+    def set_digit(self, row, col, digit):
+        """Enter `digit` (0 to clear) and return the cells whose conflict state may have changed."""
+        old = self.cells[row][col]
+        if digit == old:
+            return []
+        cell = (row, col)
+        affected = {cell}
+        for unit in self._units(row, col):
+            if old:
+                unit[old].discard(cell)
+                affected.update(unit[old])
+            if digit:
+                affected.update(unit[digit])
+                unit[digit].add(cell)
+        self.cells[row][col] = digit
+        self.filled += bool(digit) - bool(old)
+        for other in affected:
+            if self._clashes(*other):
+                self.conflicting.add(other)
+            else:
+                self.conflicting.discard(other)
+        return affected
+
+    def is_conflict(self, row, col):
+        return (row, col) in self.conflicting
+
+    def is_solved(self):
+        """True once every cell is filled and nothing clashes."""
+        return self.filled == self.side * self.side and not self.conflicting
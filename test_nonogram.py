@@ -0,0 +1,38 @@
+import random
+
+import pytest
+
+from nonogram import generate_nonogram, make_unique, validate_nonogram
+from nonogram_solver import count_solutions
+
+
+@pytest.mark.parametrize("size", [25, 30])
+@pytest.mark.parametrize("density", [0.5, 0.6, 0.7])
+def test_unique_generation_keeps_density(size, density):
+    rng = random.Random(f"{size}:{density}")
+    grid, row_clues, column_clues = generate_nonogram(size, size, density, unique=True, rng=rng)
+    assert validate_nonogram(grid, row_clues, column_clues)
+    assert count_solutions(row_clues, column_clues, limit=2)[0] == 1
+    fill = sum(map(sum, grid)) / (size * size)
+    assert density - 0.05 <= fill <= density + 0.07
+
+
+@pytest.mark.parametrize("size", [40, 50])
+def test_unique_generation_of_large_puzzles(size):
+    rng = random.Random(size)
+    for _ in range(3):
+        grid, row_clues, column_clues = generate_nonogram(size, size, unique=True, rng=rng)
+        assert validate_nonogram(grid, row_clues, column_clues)
+
+
+def test_minimal_repair_keeps_the_fill():
+    rng = random.Random(1)
+    grid = [[1 if rng.random() < 0.6 else 0 for _ in range(20)] for _ in range(20)]
+    original = [row[:] for row in grid]
+    clues = make_unique(grid, max_branches=1000, minimal=True, rng=rng)
+    if clues is None:
+        pytest.skip("this grid could not be repaired")
+    changed = sum(a != b for row, old in zip(grid, original) for a, b in zip(row, old))
+    assert abs(sum(map(sum, grid)) - sum(map(sum, original))) <= 1
+    assert changed <= 40
+    assert count_solutions(clues[0], clues[1], limit=2)[0] == 1
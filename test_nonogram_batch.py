@@ -0,0 +1,36 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from nonogram import calculate_clues, validate_nonogram
+from nonogram_batch import generate_nonograms, pack_clues, validate_batch
+
+
+def test_matches_validate_nonogram():
+    grids, row_clues, column_clues = generate_nonograms(50, 8, 9, rng=0)
+    grids[::3, 2, 4] ^= True
+    lists = grids.astype(int).tolist()
+    result = validate_batch(lists, row_clues, column_clues)
+    assert result.valid.tolist() == [validate_nonogram(*puzzle) for puzzle in zip(lists, row_clues, column_clues)]
+    packed = validate_batch(grids, pack_clues(row_clues, 9), pack_clues(column_clues, 8))
+    assert packed.valid.tolist() == result.valid.tolist()
+
+
+@pytest.mark.parametrize("bad_clue", [[1, 300], [1, -1], [256]])
+def test_malformed_clues_are_bad_lines(bad_clue):
+    grid = [[1, 0, 1]]
+    columns = [calculate_clues([cell]) for cell in grid[0]]
+    result = validate_batch([grid], [[bad_clue]], [columns])
+    assert not result.valid[0]
+    assert result.bad_rows.tolist() == [[True]]
+
+
+def test_long_runs_are_packed():
+    packed = pack_clues([[[300], [0]]], 300)
+    assert packed[0, :, :2].tolist() == [[1, 300], [0, 0]]
+
+
+def test_empty_batch():
+    result = validate_batch([], [], [])
+    assert result.valid.shape == (0,)
+    assert result.bad_rows.shape[0] == result.bad_columns.shape[0] == 0
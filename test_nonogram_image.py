@@ -0,0 +1,53 @@
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from nonogram_image import convert_folder, image_grid, image_nonogram, ink_from_pixels, parse_netpbm
+
+
+def _disc(size=40):
+    y, x = np.mgrid[:size, :size]
+    return ((x - size / 2) ** 2 + (y - size / 2) ** 2 < (size / 3) ** 2).astype(np.float32)
+
+
+@pytest.mark.parametrize("data", [b"P5 0 0 255\n", b"P2 0 3 255\n", b"P1 3 0\n", b"P2 2 2 0\n0 0 0 0\n",
+                                  b"P5 1 1 70000\n\x00\x00"])
+def test_parse_netpbm_rejects_empty_images_and_bad_maxval(data):
+    with pytest.raises(ValueError):
+        parse_netpbm(data)
+
+
+@pytest.mark.parametrize("pixels, maxval", [(np.zeros((0, 4)), 255), (np.zeros((3, 3, 0)), 255),
+                                            (np.zeros((2, 2)), 0), (np.zeros((2, 2)), -1)])
+def test_ink_from_pixels_rejects_empty_arrays_and_bad_maxval(pixels, maxval):
+    with pytest.raises(ValueError):
+        ink_from_pixels(pixels, maxval)
+
+
+def test_image_grid_rejects_empty_ink():
+    with pytest.raises(ValueError):
+        image_grid(np.zeros((0, 0)), 5, 5)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_bad_files_become_error_records(tmp_path, workers):
+    (tmp_path / "a_empty.npy").write_bytes(b"")
+    (tmp_path / "b_zero.pgm").write_bytes(b"P5 0 0 255\n")
+    (tmp_path / "c_maxval.pgm").write_bytes(b"P2 2 2 0\n0 0 0 0\n")
+    np.save(tmp_path / "d_channels.npy", np.zeros((3, 3, 0)))
+    np.save(tmp_path / "e_good.npy", ((1 - _disc()) * 255).astype(np.uint8))
+    paths = sorted(str(path) for path in tmp_path.iterdir())
+    records = list(convert_folder(paths, 10, 10, workers=workers))
+    assert [record["index"] for record in records] == list(range(5))
+    assert all("error" in record for record in records[:4])
+    assert records[4]["valid"] and "error" not in records[4]
+
+
+def test_unique_picture_changes_few_cells():
+    ink = _disc()
+    original = image_grid(ink, 15, 15)
+    grid, row_clues, column_clues = image_nonogram(ink, 15, 15, unique=True, rng=random.Random(0))
+    changed = sum(a != b for row, old in zip(grid, original) for a, b in zip(row, old))
+    assert changed <= 5
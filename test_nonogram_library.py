@@ -0,0 +1,38 @@
+import random
+
+from nonogram import generate_nonogram
+from nonogram_library import PuzzleLibrary
+
+
+def _fill(library, n, rng, seed_prefix="s"):
+    for i in range(n):
+        grid, row_clues, column_clues = generate_nonogram(5, 5, rng=rng)
+        library.append(grid, row_clues, column_clues, seed=f"{seed_prefix}{i}")
+
+
+def test_appending_during_iteration(tmp_path):
+    rng = random.Random(1)
+    with PuzzleLibrary(str(tmp_path), "a") as library:
+        _fill(library, 5, rng)
+        seen = []
+        for puzzle in library:
+            seen.append(puzzle.seed)
+            # Grows the data file, so the next lookups remap it
+            _fill(library, 1, rng, seed_prefix=f"extra{len(seen)}-")
+            library.get(library.offsets(5, 5)[-1])
+        assert seen == [f"s{i}" for i in range(5)]
+        assert library.count(5, 5) == 10
+        assert not library.check()
+
+
+def test_find_seed_sees_later_appends(tmp_path):
+    rng = random.Random(2)
+    with PuzzleLibrary(str(tmp_path), "a") as library:
+        _fill(library, 20, rng)
+        assert library.find_seed("s7").seed == "s7"
+        assert library.find_seed("missing") is None
+        _fill(library, 3, rng, seed_prefix="t")
+        assert library.find_seed("t2").seed == "t2"
+        assert library.find_seed("s19").seed == "s19"
+    with PuzzleLibrary(str(tmp_path)) as library:
+        assert library.find_seed("t0").seed == "t0"
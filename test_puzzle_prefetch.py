@@ -0,0 +1,42 @@
+import threading
+
+from puzzle_prefetch import PuzzlePrefetcher
+
+
+def test_failures_reach_the_waiting_callers():
+    def broken():
+        raise KeyError("no puzzle")
+
+    errors = []
+    done = threading.Event()
+    prefetcher = PuzzlePrefetcher(broken, depth=2)
+    try:
+        prefetcher.get(lambda puzzle: None, lambda error: (errors.append(error), done.set()))
+        assert done.wait(5)
+        assert isinstance(errors[0], KeyError)
+        # Later callers hear about it too
+        done.clear()
+        prefetcher.get(lambda puzzle: None, lambda error: done.set())
+        assert done.wait(5)
+    finally:
+        prefetcher.stop()
+
+
+def test_worker_recovers_after_failures():
+    attempts = []
+
+    def flaky():
+        attempts.append(None)
+        if len(attempts) < 3:
+            raise ValueError("not yet")
+        return len(attempts)
+
+    puzzles = []
+    done = threading.Event()
+    prefetcher = PuzzlePrefetcher(flaky, depth=1)
+    try:
+        prefetcher.get(lambda puzzle: (puzzles.append(puzzle), done.set()))
+        assert done.wait(5)
+        assert puzzles == [3]
+    finally:
+        prefetcher.stop()